@@ -0,0 +1,351 @@
+import json
+import csv
+import os
+import random
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+import numpy as np
+from time import perf_counter
+
+import suncg_loader
+
+# coarse classes of the real ModelCategoryMapping.csv that the benchmarks label
+LABEL_LIST = ["desk", "chair", "table", "door", "window", "sofa", "bed", "curtain", "shelving"]
+OTHER_LABEL_LIST = ["plant", "television", "lamp", "mirror", "toilet", "sink", "stand", "computer", "kitchen_appliance", "picture_frame"]
+
+def get_bbox(x_min, x_max, y_min, y_max, z_min, z_max):
+    # SUNCG houses are y up, the loaders read them as x, z on the floor and y up
+    return {"min" : [x_min, z_min, y_min], "max" : [x_max, z_max, y_max]}
+
+def create_model_category_csv(csv_path, model_num, seed=0):
+    rng = random.Random(seed)
+
+    all_label_list = LABEL_LIST + OTHER_LABEL_LIST
+
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["index", "model_id", "fine_grained_class", "coarse_grained_class", "empty_struct_obj", "nyuv2_40class", "wnsynsetid", "wnsynsetkey"])
+
+        for i in range(model_num):
+            label = all_label_list[rng.randint(0, len(all_label_list) - 1)]
+            writer.writerow([i + 1, str(i), label + "_" + str(i % 7), label, "", label, "", ""])
+
+def create_house_dict(house_id, level_num, room_num, node_num, model_num, rng):
+    # room_num rooms per level and node_num nodes per room, laid out on a grid so every node has a room
+    level_list = []
+    room_grid_num = int(np.ceil(np.sqrt(room_num)))
+    room_size = 5.0
+    level_size = room_grid_num * room_size
+
+    for level_index in range(level_num):
+        z_min = level_index * 3.0
+
+        node_list = []
+        object_node_list = []
+
+        for room_index in range(room_num):
+            room_x_min = (room_index % room_grid_num) * room_size
+            room_y_min = (room_index // room_grid_num) * room_size
+
+            node_list.append({
+                "id" : str(level_index) + "_" + str(len(node_list)),
+                "type" : "Room",
+                "valid" : 1,
+                "modelId" : "fr_" + str(level_index) + "rm_" + str(room_index),
+                "bbox" : get_bbox(room_x_min, room_x_min + room_size, room_y_min, room_y_min + room_size, z_min, z_min + 2.8),
+                "materials" : [{"name" : "wall", "texture" : "wallp_0"}, {"name" : "floor", "texture" : "wood_1"}],
+                "nodeIndices" : []
+            })
+
+            for _ in range(node_num):
+                x_min = room_x_min + rng.uniform(0.1, room_size - 1.6)
+                y_min = room_y_min + rng.uniform(0.1, room_size - 1.6)
+                node_z_min = z_min + rng.uniform(0.0, 2.0)
+
+                object_node_list.append({
+                    "type" : "Object",
+                    "valid" : 1,
+                    "modelId" : str(rng.randint(0, model_num - 1)),
+                    "bbox" : get_bbox(x_min, x_min + rng.uniform(0.2, 1.5), y_min, y_min + rng.uniform(0.2, 1.5), node_z_min, node_z_min + rng.uniform(0.1, 0.8)),
+                    "transform" : [rng.uniform(-1, 1) for _ in range(16)],
+                    "materials" : [{"name" : "Material", "diffuse" : "#ffffff"}]
+                })
+
+        for object_node in object_node_list:
+            object_node["id"] = str(level_index) + "_" + str(len(node_list))
+            node_list.append(object_node)
+
+        node_list[room_num - 1]["nodeIndices"] = list(range(room_num, len(node_list)))
+
+        level_list.append({
+            "id" : str(level_index),
+            "bbox" : get_bbox(0.0, level_size, 0.0, level_size, z_min, z_min + 3.0),
+            "nodes" : node_list
+        })
+
+    return {
+        "id" : house_id,
+        "up" : [0, 1, 0],
+        "front" : [0, 0, 1],
+        "scaleToMeters" : 1,
+        "bbox" : get_bbox(0.0, level_size, 0.0, level_size, 0.0, level_num * 3.0),
+        "levels" : level_list
+    }
+
+# written next to the synthetic files, only a dataset_path with it is replaced by create_dataset
+DATASET_MARK_FILE_NAME = "suncg_benchmark_dataset"
+
+def create_dataset(dataset_path, house_num, level_num, room_num, node_num, model_num, seed=0):
+    # dataset_path/house/<json_id>/house.json and dataset_path/ModelCategoryMapping.csv, same seed gives the same files
+    rng = random.Random(seed)
+
+    house_path = dataset_path + "house/"
+    csv_path = dataset_path + "ModelCategoryMapping.csv"
+    mark_file_path = dataset_path + DATASET_MARK_FILE_NAME
+
+    # a real SUNCG root must never be deleted or overwritten
+    if not os.path.exists(mark_file_path):
+        if (os.path.exists(house_path) and len(os.listdir(house_path)) > 0) or os.path.exists(csv_path):
+            raise ValueError("dataset_path already has a dataset that was not created by this script : " + dataset_path)
+
+    os.makedirs(dataset_path, exist_ok=True)
+    with open(mark_file_path, "w") as f:
+        f.write("synthetic dataset of benchmark.py, this folder is replaced by the next run\n")
+
+    if os.path.exists(house_path):
+        shutil.rmtree(house_path)
+
+    for i in range(house_num):
+        json_id = "%08x" % rng.getrandbits(32)
+        os.makedirs(house_path + json_id)
+
+        with open(house_path + json_id + "/house.json", "w") as f:
+            json.dump(create_house_dict(json_id, level_num, room_num, node_num, model_num, rng), f)
+
+    create_model_category_csv(csv_path, model_num, seed)
+
+def measure(function, repeat):
+    # best of repeat runs, the others are noise from the machine
+    best_time = None
+    for _ in range(repeat):
+        start_time = perf_counter()
+        count = function()
+        run_time = perf_counter() - start_time
+        if best_time is None or run_time < best_time:
+            best_time = run_time
+
+    return best_time, count
+
+def get_git_commit(path):
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=path, stderr=subprocess.DEVNULL).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Benchmark:
+    def __init__(self, dataset_path, work_path, target_width, target_height, repeat, batch_size):
+        self.dataset_path = dataset_path
+        self.work_path = work_path
+        self.target_width = target_width
+        self.target_height = target_height
+        self.repeat = repeat
+        self.batch_size = batch_size
+
+        self.json_id_path = self.dataset_path + "house/"
+        self.csv_path = self.dataset_path + "ModelCategoryMapping.csv"
+
+        self.json_id_list = sorted(os.listdir(self.json_id_path))
+        self.json_file_path_list = [self.json_id_path + json_id + "/house.json" for json_id in self.json_id_list]
+
+        self.result_list = []
+
+    def add_result(self, name, unit, function):
+        run_time, count = measure(function, self.repeat)
+
+        result = {
+            "name" : name,
+            "unit" : unit,
+            "count" : count,
+            "seconds" : run_time,
+            "per_second" : count / run_time if run_time > 0 else None
+        }
+        self.result_list.append(result)
+
+        print("%-24s %10d %-10s %10.4f s %12.1f /s" % (name, count, unit, run_time, result["per_second"]))
+
+    def create_database(self, save_path, free_label=False, **kwargs):
+        return suncg_loader.SUNCGDataBase(self.json_id_path,
+                                            self.target_width,
+                                            self.target_height,
+                                            True,
+                                            self.csv_path,
+                                            LABEL_LIST,
+                                            False,
+                                            1,
+                                            ["House", "Level", "Room"],
+                                            save_path,
+                                            1,
+                                            False,
+                                            free_label,
+                                            np.uint8,
+                                            **kwargs)
+
+    def create_label(self):
+        # nothing is saved or kept, so the scopes to rasterize are given, otherwise none of them would be built
+        label = suncg_loader.Label(self.csv_path, LABEL_LIST, False, 1, [], self.work_path + "label/", 1, False, True, np.uint8,
+                                    label_scope_list=["House", "Level", "Room"])
+        label.save_enabled = False
+        return label
+
+    def load_house_list(self):
+        house_list = []
+        for json_id, json_file_path in zip(self.json_id_list, self.json_file_path_list):
+            house_list.append(suncg_loader.load_house(json_id, json_file_path, self.target_width, self.target_height, True))
+        return house_list
+
+    def run(self):
+        json_dict_list = [suncg_loader.load_house_json(json_file_path) for json_file_path in self.json_file_path_list]
+        node_num = sum(len(level["nodes"]) for json_dict in json_dict_list for level in json_dict["levels"])
+
+        def decode():
+            for json_file_path in self.json_file_path_list:
+                suncg_loader.load_house_json(json_file_path)
+            return len(self.json_file_path_list)
+        self.add_result("json_decode", "house", decode)
+
+        def assign():
+            for json_id, json_dict in zip(self.json_id_list, json_dict_list):
+                suncg_loader.House(json_id, self.target_width, self.target_height, True).load_json_dict(json_dict)
+            return node_num
+        self.add_result("hierarchy_assign", "node", assign)
+
+        cache_path = self.work_path + "cache/"
+        os.makedirs(cache_path, exist_ok=True)
+        for json_id, json_file_path in zip(self.json_id_list, self.json_file_path_list):
+            suncg_loader.load_house(json_id, json_file_path, self.target_width, self.target_height, True, cache_path)
+
+        def load_cache():
+            for json_id, json_file_path in zip(self.json_id_list, self.json_file_path_list):
+                suncg_loader.load_house(json_id, json_file_path, self.target_width, self.target_height, True, cache_path)
+            return len(self.json_file_path_list)
+        self.add_result("cache_load", "house", load_cache)
+
+        house_list = self.load_house_list()
+        label = self.create_label()
+
+        def rasterize():
+            for house in house_list:
+                house.create_label_channel(label)
+            return len(house_list)
+        self.add_result("rasterize", "house", rasterize)
+
+        label_channel = np.random.default_rng(0).integers(0, len(LABEL_LIST) + 1, (self.target_height, self.target_width), np.uint8)
+        npy_file_path = self.work_path + "write.npy"
+        write_num = 20000
+
+        def write_npy():
+            writer = suncg_loader.NpyWriter(npy_file_path, np.uint8)
+            for _ in range(write_num):
+                writer.write(label_channel)
+            writer.close()
+            return write_num
+        self.add_result("npy_write", "channel", write_npy)
+
+        def build():
+            self.create_database(self.work_path + "build.npy")
+            return len(self.json_file_path_list)
+        self.add_result("database_build", "house", build)
+
+        database = self.create_database(self.work_path + "sample.npy", label_store_path=self.work_path + "store/")
+        sample_num = 20000
+
+        def sample():
+            random.seed(0)
+            for _ in range(sample_num):
+                database.load_label_channel("Room")
+            return sample_num
+        self.add_result("sample_channel", "channel", sample)
+
+        batch = database.sample_batch("Room", self.batch_size)
+        batch_num = 500
+
+        def sample_batch():
+            for i in range(batch_num):
+                database.sample_batch("Room", self.batch_size, i, batch)
+            return batch_num * self.batch_size
+        self.add_result("sample_batch", "channel", sample_batch)
+
+        json_loader = suncg_loader.JsonLoader(self.json_id_path, self.csv_path)
+        json_loader.json_id_list.sort()
+
+        def json_loader_channel():
+            for i in range(len(json_loader.json_id_list)):
+                json_loader.create_label_channel(i)
+            return len(json_loader.json_id_list)
+        self.add_result("json_loader_channel", "house", json_loader_channel)
+
+        return self.result_list
+
+def compare_result(result_list, base_result_path):
+    with open(base_result_path, "r") as f:
+        base_result_dict = {result["name"] : result for result in json.load(f)["result_list"]}
+
+    print()
+    print("compared with :", base_result_path)
+    for result in result_list:
+        base_result = base_result_dict.get(result["name"])
+        if base_result is None or base_result["count"] != result["count"]:
+            continue
+
+        print("%-24s %8.2fx" % (result["name"], base_result["seconds"] / result["seconds"]))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmarks of suncg_loader on a synthetic dataset")
+    parser.add_argument("--house_num", type=int, default=50)
+    parser.add_argument("--level_num", type=int, default=2)
+    parser.add_argument("--room_num", type=int, default=8)
+    parser.add_argument("--node_num", type=int, default=20, help="nodes per room")
+    parser.add_argument("--model_num", type=int, default=2000)
+    parser.add_argument("--target_size", type=int, nargs=2, default=[32, 32], metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--batch_size", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dataset_path", default=None, help="keep the synthetic dataset here instead of a temporary folder, it must be empty or made by an earlier run")
+    parser.add_argument("--output", default=None, help="write the results as json")
+    parser.add_argument("--compare", default=None, help="json results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    work_path = tempfile.mkdtemp(prefix="suncg_benchmark_") + "/"
+
+    dataset_path = args.dataset_path
+    if dataset_path is None:
+        dataset_path = work_path + "dataset/"
+    if dataset_path[-1] != "/":
+        dataset_path += "/"
+
+    try:
+        create_dataset(dataset_path, args.house_num, args.level_num, args.room_num, args.node_num, args.model_num, args.seed)
+
+        benchmark = Benchmark(dataset_path, work_path, args.target_size[0], args.target_size[1], args.repeat, args.batch_size)
+        result_list = benchmark.run()
+    finally:
+        shutil.rmtree(work_path)
+
+    info = {
+        "commit" : get_git_commit(os.path.dirname(os.path.abspath(__file__))),
+        "python" : platform.python_version(),
+        "numpy" : np.__version__,
+        "platform" : platform.platform(),
+        "args" : vars(args)
+    }
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"info" : info, "result_list" : result_list}, f, indent=4)
+        print("Saved results at :", args.output)
+
+    if args.compare is not None:
+        compare_result(result_list, args.compare)
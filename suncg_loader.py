@@ -4,9 +4,395 @@ import numpy as np
 import os
 import csv
 import random
-from time import time
+import hashlib
+import re
+import struct
+import copy
+import queue
+import threading
+import traceback
+import weakref
+import zipfile
+from time import time, perf_counter
+from multiprocessing import Pool, Process, Queue
+from multiprocessing.shared_memory import SharedMemory
+from collections import OrderedDict
+
+def create_model_label_dict(csv_data, label_list):
+    label_index_dict = {}
+    for i in range(len(label_list)):
+        if label_list[i] not in label_index_dict:
+            label_index_dict[label_list[i]] = i + 1
+
+    model_label_dict = {}
+    for line in csv_data:
+        if line[1] in model_label_dict:
+            continue
+        # models without a coarse_grained_class are never labeled, even when "" is in label_list
+        if line[3] == "":
+            model_label_dict[line[1]] = None
+            continue
+        model_label_dict[line[1]] = label_index_dict.get(line[3])
+
+    return model_label_dict
+
+def get_label_vocabulary(csv_data):
+    # every coarse_grained_class of the csv in sorted order, the names valid_label_list is made of
+    label_set = set()
+    for line in csv_data:
+        if len(line) > 3 and line[1] != "model_id" and line[3] != "":
+            label_set.add(line[3])
+
+    return sorted(label_set)
+
+def remap_label_channel(label_channel, lut, out=None):
+    # label index channels of any shape, e.g. a whole .npy file, to the label set of Label.create_remap_lut
+    return np.take(lut, label_channel, axis=0, out=out)
+
+def remap_npy(source_file_path, target_file_path, lut, chunk_row_num=256, remap_index=None, min_node_num=1):
+    # remaps a .npy file of label index channels chunk by chunk, so it does not need to fit in memory
+    # with remap_index of Label.create_remap_index, the rows with less than min_node_num nodes of the other label set are dropped
+    # like a build with that label set would do, the node counts are read from the file of get_label_count_path
+    source_data = np.load(source_file_path, mmap_mode="r")
+
+    row_array = np.arange(source_data.shape[0])
+    if remap_index is not None:
+        label_count = np.load(get_label_count_path(source_file_path))
+        if label_count.shape != (source_data.shape[0], remap_index.shape[0]):
+            raise ValueError("label counts do not match the label channels of " + source_file_path)
+        valid_node_num_array = label_count[:, remap_index > 0].sum(axis=1)
+        row_array = np.nonzero(valid_node_num_array >= min_node_num)[0]
+
+    writer = NpyWriter(target_file_path, lut.dtype)
+    for start in range(0, row_array.shape[0], chunk_row_num):
+        chunk_row_array = row_array[start:start + chunk_row_num]
+        # the rows are sorted, a contiguous chunk is read as a slice
+        if chunk_row_array[-1] - chunk_row_array[0] + 1 == chunk_row_array.shape[0]:
+            source_chunk = source_data[chunk_row_array[0]:chunk_row_array[-1] + 1]
+        else:
+            source_chunk = source_data[chunk_row_array]
+        writer.write_rows(remap_label_channel(source_chunk, lut))
+    writer.close()
+
+    del source_data
+
+HOUSE_CACHE_VERSION = "2"
+
+# per-node arrays the loaders never read, they are cut out before decoding
+UNUSED_JSON_ARRAY_PATTERN = re.compile(r'"(?:transform|materials|nodeIndices)"\s*:\s*\[[^\[\]]*\]')
+
+def load_house_json(json_file_path):
+    with open(json_file_path, "r") as f:
+        json_str = f.read()
+
+    try:
+        return json.loads(UNUSED_JSON_ARRAY_PATTERN.sub('"unused":0', json_str))
+    except json.JSONDecodeError:
+        # e.g. a "]" inside a string of a cut array, decode everything instead
+        return json.loads(json_str)
+
+def get_json_stat(json_file_path):
+    json_file_path = os.path.abspath(json_file_path)
+    stat = os.stat(json_file_path)
+    return [json_file_path, str(stat.st_mtime_ns), str(stat.st_size), HOUSE_CACHE_VERSION]
+
+def get_resolution_path(path, target_width, target_height):
+    # label_channel.npy -> label_channel_32x32.npy, label_channel/ -> label_channel/32x32/
+    if path is None:
+        return None
+
+    size_name = str(target_width) + "x" + str(target_height)
+
+    if path[-1] == "/":
+        return path + size_name + "/"
+
+    path_root, path_ext = os.path.splitext(path)
+    return path_root + "_" + size_name + path_ext
+
+def get_label_count_path(save_path):
+    # label_channel.npy -> label_channel_label_count.npy
+    path_root, path_ext = os.path.splitext(save_path)
+    return path_root + "_label_count" + path_ext
+
+def get_cache_file_path(cache_path, json_file_path):
+    return cache_path + hashlib.md5(os.path.abspath(json_file_path).encode("utf-8")).hexdigest() + ".npz"
+
+def transform_bbox_array(bbox_array, scale_x, scale_y, trans):
+    # same as Node.update_trans for every row of [x_min, x_max, y_min, y_max], astype truncates like int()
+    scale = np.array([scale_x, scale_x, scale_y, scale_y])
+    offset = np.array([trans[0], trans[0], trans[1], trans[1]], np.int64)
+    return (bbox_array * scale).astype(np.int64) + offset
+
+def paint_rectangles(label_channel, rect_array, color_array, channel_array=None):
+    # rect_array rows are [x_min, x_max, y_min, y_max] like transform_bbox_array returns
+    # filled rectangles with inclusive corners like cv2.rectangle(..., -1), later rows are painted over earlier ones
+    # with channel_array, each rectangle is only painted in its channel and the other channels are kept
+    height, width = label_channel.shape[:2]
+
+    corner_array = rect_array.reshape(-1, 2, 2)
+    limit = np.array([width, height])
+    start_array = np.minimum(np.maximum(corner_array.min(axis=2), 0), limit)
+    end_array = np.minimum(np.maximum(corner_array.max(axis=2) + 1, 0), limit)
+
+    if channel_array is None:
+        for start, end, color in zip(start_array.tolist(), end_array.tolist(), color_array.tolist()):
+            label_channel[start[1]:end[1], start[0]:end[0]] = color
+        return
+
+    for start, end, color, channel in zip(start_array.tolist(), end_array.tolist(), color_array.tolist(), channel_array.tolist()):
+        label_channel[start[1]:end[1], start[0]:end[0], channel] = color
+
+def paint_label_rectangles(label_channel, rect_array, label_index_array, label):
+    # one hot label channels with one_hot_overlap="any" keep every label that covers a pixel, otherwise the last one is kept
+    if label.one_hot and label.one_hot_overlap == "any" and label.channel_num > 1:
+        channel_array = label_index_array - 1
+        paint_rectangles(label_channel, rect_array, label.color_array[label_index_array, channel_array], channel_array)
+        return
+
+    paint_rectangles(label_channel, rect_array, label.color_array[label_index_array])
+
+def paint_node_label(label_channel, node_array, node_start, node_end, label, scale_x, scale_y, trans):
+    if node_array is None or node_end <= node_start:
+        return 0
+
+    label_index_array = node_array.get_label_index_array(label)[node_start:node_end]
+
+    valid_mask = label_index_array > 0
+    if not valid_mask.any():
+        return 0
+
+    if label.stats is not None:
+        start_time = perf_counter()
+
+    rect_array = transform_bbox_array(node_array.bbox_array[node_start:node_end, :4][valid_mask], scale_x, scale_y, trans)
+    paint_label_rectangles(label_channel, rect_array, label_index_array[valid_mask], label)
+
+    if label.stats is not None:
+        label.stats.add_time("rasterize", start_time)
+
+    return rect_array.shape[0]
+
+def create_node_rect_array(node_array, node_start, node_end, label, scale_x, scale_y, trans, width, height):
+    # rows of [label_index, x_min, x_max, y_min, y_max] that paint_node_label would paint, clipped to the label channel
+    # rectangles that are out of the label channel are dropped, they are still counted like in paint_node_label
+    rect_array = np.zeros((0, 5), np.int32)
+
+    if node_array is None or node_end <= node_start:
+        return rect_array, 0
+
+    label_index_array = node_array.get_label_index_array(label)[node_start:node_end]
+
+    valid_mask = label_index_array > 0
+    if not valid_mask.any():
+        return rect_array, 0
+
+    if label.stats is not None:
+        start_time = perf_counter()
+
+    corner_array = transform_bbox_array(node_array.bbox_array[node_start:node_end, :4][valid_mask], scale_x, scale_y, trans).reshape(-1, 2, 2)
+    limit = np.array([width, height])
+    start_array = np.minimum(np.maximum(corner_array.min(axis=2), 0), limit)
+    end_array = np.minimum(np.maximum(corner_array.max(axis=2) + 1, 0), limit) - 1
+
+    inside_mask = (end_array >= start_array).all(axis=1)
+
+    rect_array = np.empty((int(inside_mask.sum()), 5), np.int32)
+    rect_array[:, 0] = label_index_array[valid_mask][inside_mask]
+    rect_array[:, 1:] = np.stack([start_array, end_array], axis=2)[inside_mask].reshape(-1, 4)
+
+    if label.stats is not None:
+        label.stats.add_time("rasterize", start_time)
+
+    return rect_array, corner_array.shape[0]
+
+def augment_rect_array(rect_array, width, height, flip_x=False, flip_y=False, rot90=0, shift_x=0, shift_y=0):
+    # same as np.flip of the x and y axis, then np.rot90(label_channel, rot90), then a shift with zeros coming in
+    # returns the new rows and the width and height of the new label channel
+    x_array = rect_array[:, 1:3]
+    y_array = rect_array[:, 3:5]
+
+    if flip_x:
+        x_array = width - 1 - x_array[:, ::-1]
+    if flip_y:
+        y_array = height - 1 - y_array[:, ::-1]
+
+    for _ in range(rot90 % 4):
+        x_array, y_array = y_array, width - 1 - x_array[:, ::-1]
+        width, height = height, width
+
+    augmented_rect_array = np.empty_like(rect_array)
+    augmented_rect_array[:, 0] = rect_array[:, 0]
+    augmented_rect_array[:, 1:3] = x_array + shift_x
+    augmented_rect_array[:, 3:5] = y_array + shift_y
+
+    return augmented_rect_array, width, height
+
+def sample_augment_args_list(rng, sample_num, max_shift=0, rot90_step=1):
+    # [flip_x, flip_y, rot90, shift_x, shift_y] of augment_rect_array for each sample, rot90_step=2 keeps the width and height
+    flip_list = (rng.random((sample_num, 2)) < 0.5).tolist()
+    rot90_list = (rng.integers(0, 4 // rot90_step, sample_num) * rot90_step).tolist()
+    shift_list = rng.integers(-max_shift, max_shift + 1, (sample_num, 2)).tolist()
+
+    augment_args_list = []
+    for flip, rot90, shift in zip(flip_list, rot90_list, shift_list):
+        augment_args_list.append(flip + [rot90] + shift)
+
+    return augment_args_list
+
+def create_label_channel_array(label, width, height):
+    if label.channel_num == 1:
+        return np.zeros((height, width), label.number_type)
+
+    return np.zeros((height, width, label.channel_num), label.number_type)
+
+def count_node_label(node_array, node_start, node_end, label):
+    # nodes per label index, index 0 counts the nodes without a valid label
+    label_count = np.zeros(len(label.valid_label_list) + 1, np.int32)
+    if node_array is None or node_end <= node_start:
+        return label_count
+
+    label_index_array = node_array.get_label_index_array(label)[node_start:node_end]
+    label_count += np.bincount(label_index_array, minlength=label_count.shape[0]).astype(np.int32)
+    return label_count
+
+def create_scope_label(scope_object, object_type, label):
+    # saved with the label channel, so remap_npy can check min_node_num for another label set
+    scope_object.label_count = None
+    if label.save_enabled and label.save_as_npy and object_type in label.save_object:
+        scope_object.label_count = count_node_label(scope_object.node_array, scope_object.node_start, scope_object.node_end, label)
+
+    # with label.sparse_label only the rectangles are kept, the label channel is painted when it is saved
+    if not label.sparse_label:
+        scope_object.label_channel = create_label_channel_array(label, scope_object.width, scope_object.height)
+
+        return paint_node_label(scope_object.label_channel, scope_object.node_array, scope_object.node_start, scope_object.node_end,
+                                label, scope_object.scale_x, scope_object.scale_y, scope_object.trans)
+
+    scope_object.label_rect_array, valid_node_num = create_node_rect_array(scope_object.node_array, scope_object.node_start, scope_object.node_end,
+                                                                            label, scope_object.scale_x, scope_object.scale_y, scope_object.trans,
+                                                                            scope_object.width, scope_object.height)
+
+    scope_object.label_channel = None
+    if label.save_enabled and label.save_path is not None and object_type in label.save_object:
+        scope_object.label_channel = create_label_channel_array(label, scope_object.width, scope_object.height)
+        paint_rect_label(scope_object.label_channel, scope_object.label_rect_array, label)
+
+    return valid_node_num
+
+def paint_rect_label(label_channel, rect_array, label):
+    paint_label_rectangles(label_channel, rect_array[:, 1:], rect_array[:, 0], label)
+
+def pack_label_channel(label_channel, keep_channel=False):
+    # one bit per pixel in rows of ceil(width / 8) bytes along the width
+    # the channels of a binary label channel are all the same, so only the first one is packed unless keep_channel
+    if label_channel.ndim == 3 and not keep_channel:
+        label_channel = label_channel[:, :, 0]
+
+    return np.packbits(label_channel != 0, axis=1)
+
+def unpack_label_channel(packed_array, width, color=1, out=None, keep_channel=False):
+    # packed_array is [..., ceil(width / 8)] of pack_label_channel, out is [..., width] or [..., width, channel_num] for a color of channel_num values
+    # with keep_channel, packed_array is [..., ceil(width / 8), channel_num] and out is [..., width, channel_num]
+    if keep_channel:
+        bit_array = np.unpackbits(packed_array, axis=-2, count=width)
+    else:
+        bit_array = np.unpackbits(packed_array, axis=-1, count=width)
+        if np.ndim(color) > 0:
+            bit_array = bit_array[..., None]
+
+    if out is None:
+        return bit_array * color
+
+    np.multiply(bit_array, color, out=out, casting="unsafe")
+    return out
+
+def get_contain_matrix(box_array, container_array):
+    # rows of [x_min, x_max, y_min, y_max, z_min, z_max], same test as House.add_node
+    return ((box_array[:, None, 0::2] >= container_array[None, :, 0::2]).all(2) &
+            (box_array[:, None, 1::2] <= container_array[None, :, 1::2]).all(2))
+
+class ContainerIndex:
+    # below this number of containers a plain contain matrix is faster than the grid
+    grid_container_num = 16
+
+    def __init__(self, container_array, container_time=None):
+        self.container_array = container_array
+        # a container is only a candidate for boxes with a larger time, e.g. rooms that were already added
+        self.container_time = container_time
+
+        self.grid_num = None
+        self.grid_min = None
+        self.grid_max = None
+        self.cell_size = None
+        self.cell_list = None
+
+        if self.container_array.shape[0] > self.grid_container_num:
+            self.create_grid()
+
+    def get_cell(self, x_array, y_array):
+        cell_x = np.clip(np.floor((x_array - self.grid_min[0]) / self.cell_size[0]).astype(np.int64), 0, self.grid_num - 1)
+        cell_y = np.clip(np.floor((y_array - self.grid_min[1]) / self.cell_size[1]).astype(np.int64), 0, self.grid_num - 1)
+        return cell_x, cell_y
+
+    def create_grid(self):
+        container_num = self.container_array.shape[0]
+
+        self.grid_num = int(np.ceil(np.sqrt(container_num)))
+        self.grid_min = np.array([self.container_array[:, 0].min(), self.container_array[:, 2].min()])
+        self.grid_max = np.array([self.container_array[:, 1].max(), self.container_array[:, 3].max()])
+        self.cell_size = (self.grid_max - self.grid_min) / self.grid_num
+        self.cell_size[self.cell_size <= 0] = 1.0
+
+        cell_x_min, cell_y_min = self.get_cell(self.container_array[:, 0], self.container_array[:, 2])
+        cell_x_max, cell_y_max = self.get_cell(self.container_array[:, 1], self.container_array[:, 3])
+
+        cell_list = [[] for i in range(self.grid_num * self.grid_num)]
+        for i in range(container_num):
+            for cell_y in range(cell_y_min[i], cell_y_max[i] + 1):
+                for cell_x in range(cell_x_min[i], cell_x_max[i] + 1):
+                    cell_list[cell_y * self.grid_num + cell_x].append(i)
+
+        # containers stay in ascending order in each cell, so the first match is still the first container
+        self.cell_list = [np.array(cell, np.int64) for cell in cell_list]
+
+    def find_in(self, box_array, box_time, candidate_index):
+        contain_matrix = get_contain_matrix(box_array, self.container_array[candidate_index])
+        if self.container_time is not None:
+            contain_matrix &= self.container_time[candidate_index][None, :] < box_time[:, None]
+
+        first_index = np.argmax(contain_matrix, 1)
+        return np.where(contain_matrix.any(1), candidate_index[first_index], -1)
+
+    def find(self, box_array, box_time=None):
+        if self.cell_list is None and box_array.shape[0] > 0 and self.container_array.shape[0] > 0:
+            return self.find_in(box_array, box_time, np.arange(self.container_array.shape[0]))
+
+        container_index = np.full(box_array.shape[0], -1, np.int64)
+        if box_array.shape[0] == 0 or self.container_array.shape[0] == 0:
+            return container_index
+
+        # a container of the box also contains its (x_min, y_min) corner, so only the containers of that cell are candidates
+        inside_mask = ((box_array[:, 0] >= self.grid_min[0]) & (box_array[:, 0] <= self.grid_max[0]) &
+                        (box_array[:, 2] >= self.grid_min[1]) & (box_array[:, 2] <= self.grid_max[1]))
+        cell_x, cell_y = self.get_cell(box_array[:, 0], box_array[:, 2])
+        cell_array = np.where(inside_mask, cell_y * self.grid_num + cell_x, -1)
+
+        for cell in np.unique(cell_array).tolist():
+            if cell < 0 or self.cell_list[cell].shape[0] == 0:
+                continue
+
+            box_index = np.nonzero(cell_array == cell)[0]
+            cell_box_time = None
+            if box_time is not None:
+                cell_box_time = box_time[box_index]
+            container_index[box_index] = self.find_in(box_array[box_index], cell_box_time, self.cell_list[cell])
+
+        return container_index
 
 class Node:
+    __slots__ = ["x_min", "x_max", "y_min", "y_max", "z_min", "z_max", "label", "id",
+                "trans_x_min", "trans_x_max", "trans_y_min", "trans_y_max", "trans_z_min", "trans_z_max"]
+
     def __init__(self, x_min, x_max, y_min, y_max, z_min, z_max, label):
         self.x_min = x_min
         self.x_max = x_max
@@ -33,6 +419,44 @@ class Node:
         self.trans_z_min = self.z_min + trans[2]
         self.trans_z_max = self.z_max + trans[2]
 
+class NodeArray:
+    # all the nodes of one house, levels and rooms point to [node_start, node_end) ranges of it
+    def __init__(self, bbox_array, model_index_array, model_id_list):
+        # rows of [x_min, x_max, y_min, y_max, z_min, z_max]
+        self.bbox_array = bbox_array
+        # index of the modelId of each node in model_id_list
+        self.model_index_array = model_index_array
+        self.model_id_list = model_id_list
+
+        self.label_index_array = None
+        self.label_index_owner = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["label_index_array"] = None
+        state["label_index_owner"] = None
+        return state
+
+    def get_node_num(self):
+        return self.bbox_array.shape[0]
+
+    def get_label_index_array(self, label):
+        if self.label_index_array is None or self.label_index_owner is not label:
+            if label.stats is not None:
+                start_time = perf_counter()
+
+            label_index_lut = label.get_label_index_array(self.model_id_list)
+            self.label_index_array = label_index_lut[self.model_index_array]
+            self.label_index_owner = label
+
+            if label.stats is not None:
+                label.stats.add_time("label_lookup", start_time)
+
+        return self.label_index_array
+
+    def get_node(self, index):
+        return Node(*self.bbox_array[index].tolist(), self.model_id_list[self.model_index_array[index]])
+
 class Room:
     def __init__(self, x_min, x_max, y_min, y_max, z_min, z_max, target_width, target_height, size_fixed):
         self.x_min = x_min
@@ -55,7 +479,11 @@ class Room:
         self.trans_z_max = None
 
         self.nodes_z_min = None
-        self.node_list = []
+        # nodes added after the house created its NodeArray
+        self.new_node_list = []
+        self.node_array = None
+        self.node_start = 0
+        self.node_end = 0
         self.scale_x = None
         self.scale_y = None
         self.trans = None
@@ -66,10 +494,30 @@ class Room:
         self.is_valid = False
 
         self.label_channel = None
+        # rows of create_node_rect_array when the label is sparse
+        self.label_rect_array = None
+        # nodes per label index of a label channel that is saved to npy
+        self.label_count = None
+        self.label_row = None
+
+    @property
+    def node_list(self):
+        node_list = []
+
+        if self.node_array is not None:
+            for i in range(self.node_start, self.node_end):
+                node = self.node_array.get_node(i)
+                node.id = self.id + "_" + str(len(node_list))
+                node_list.append(node)
+
+        return node_list + self.new_node_list
+
+    def get_node_num(self):
+        return self.node_end - self.node_start + len(self.new_node_list)
 
     def add_node(self, node):
-        node.id = self.id + "_" + str(len(self.node_list))
-        self.node_list.append(node)
+        node.id = self.id + "_" + str(self.get_node_num())
+        self.new_node_list.append(node)
         if self.nodes_z_min is None:
             self.nodes_z_min = node.z_min
         elif node.z_min < self.nodes_z_min:
@@ -94,55 +542,59 @@ class Room:
                 self.trans = trans
                 self.compute_trans()
             elif trans_root == "Room":
-                self.scale_x = self.target_width / (self.x_max - self.x_min)
-                self.scale_y = self.target_height / (self.y_max - self.y_min)
+                self.update_scope_trans()
 
-                if not self.size_fixed:
-                    if self.scale_y < self.scale_x:
-                        self.scale_x = self.scale_y
-                    else:
-                        self.scale_y = self.scale_x
+    def update_scope_trans(self):
+        # the transform of the room label channel
+        if not self.is_empty:
+            self.scale_x = self.target_width / (self.x_max - self.x_min)
+            self.scale_y = self.target_height / (self.y_max - self.y_min)
 
-                    self.width = int((self.x_max - self.x_min) * self.scale_x)
-                    self.height = int((self.y_max - self.y_min) * self.scale_y)
+            if not self.size_fixed:
+                if self.scale_y < self.scale_x:
+                    self.scale_x = self.scale_y
                 else:
-                    self.width = self.target_width
-                    self.height = self.target_height
+                    self.scale_y = self.scale_x
 
-                self.trans = [- int(self.x_min * self.scale_x), - int(self.y_min * self.scale_y), - self.nodes_z_min]
+                self.width = int((self.x_max - self.x_min) * self.scale_x)
+                self.height = int((self.y_max - self.y_min) * self.scale_y)
+            else:
+                self.width = self.target_width
+                self.height = self.target_height
 
-                self.compute_trans()
+            self.trans = [- int(self.x_min * self.scale_x), - int(self.y_min * self.scale_y), - self.nodes_z_min]
 
-            for node in self.node_list:
-                node.update_trans(self.scale_x, self.scale_y, self.trans)
+            self.compute_trans()
 
     def create_label_channel(self, label):
         self.is_valid = False
+        label_row = self.label_row
+        self.label_row = None
 
-        self.update_trans("Room", None, None, None)
-
-        if not self.is_empty:
-            if label.channel_num == 1:
-                self.label_channel = np.zeros((self.height, self.width), label.number_type)
-            else:
-                self.label_channel = np.zeros((self.height, self.width, label.channel_num), label.number_type)
+        if "Room" not in label.built_scope_list:
+            self.label_channel = None
+            self.label_rect_array = None
+            return
 
-            valid_node_num = 0
+        self.update_scope_trans()
 
-            for node in self.node_list:
-                label_index = label.get_label_index(node.label)
-                if label_index is not None:
-                    cv2.rectangle(self.label_channel, (node.trans_x_min, node.trans_y_min), (node.trans_x_max, node.trans_y_max), label.color_list[label_index], -1)
-                    valid_node_num += 1
+        if not self.is_empty:
+            valid_node_num = create_scope_label(self, "Room", label)
 
             if valid_node_num >= label.min_node_num:
                 self.is_valid = True
 
         if self.is_valid:
-            label.save_label_channel("Room", self.label_channel, self.id)
+            label.save_label_channel("Room", self.label_channel, self.id, self.node_end - self.node_start, valid_node_num, self.label_count)
+            self.label_row = label.store_label_channel(self.label_channel, label_row)
+        self.label_count = None
 
-        if label.free_label:
+        if label.free_label or label.sparse_label:
             self.label_channel = None
+        elif label.pack_binary and self.label_channel is not None:
+            self.label_channel = label.pack_label_channel(self.label_channel)
+        if label.free_label:
+            self.label_rect_array = None
 
 class Level:
     def __init__(self, x_min, x_max, y_min, y_max, z_min, z_max, target_width, target_height, size_fixed):
@@ -167,6 +619,9 @@ class Level:
 
         self.rooms_z_min = None
         self.room_list = []
+        self.node_array = None
+        self.node_start = 0
+        self.node_end = 0
         self.scale_x = None
         self.scale_y = None
         self.trans = None
@@ -177,6 +632,11 @@ class Level:
         self.is_valid = False
 
         self.label_channel = None
+        # rows of create_node_rect_array when the label is sparse
+        self.label_rect_array = None
+        # nodes per label index of a label channel that is saved to npy
+        self.label_count = None
+        self.label_row = None
 
     def add_node(self, node):
         for room in self.room_list:
@@ -214,59 +674,64 @@ class Level:
                 self.trans = trans
                 self.compute_trans()
             elif trans_root == "Level":
-                self.scale_x = self.target_width / (self.x_max - self.x_min)
-                self.scale_y = self.target_height / (self.y_max - self.y_min)
+                self.update_scope_trans()
 
-                if not self.size_fixed:
-                    if self.scale_y < self.scale_x:
-                        self.scale_x = self.scale_y
-                    else:
-                        self.scale_y = self.scale_x
+            for room in self.room_list:
+                room.update_trans(trans_root, self.scale_x, self.scale_y, self.trans)
 
-                    self.width = int((self.x_max - self.x_min) * self.scale_x)
-                    self.height = int((self.y_max - self.y_min) * self.scale_y)
+    def update_scope_trans(self):
+        # the transform of the level label channel, the rooms are not changed
+        if not self.is_empty:
+            self.scale_x = self.target_width / (self.x_max - self.x_min)
+            self.scale_y = self.target_height / (self.y_max - self.y_min)
+
+            if not self.size_fixed:
+                if self.scale_y < self.scale_x:
+                    self.scale_x = self.scale_y
                 else:
-                    self.width = self.target_width
-                    self.height = self.target_height
+                    self.scale_y = self.scale_x
 
-                self.trans = [- int(self.x_min * self.scale_x), - int(self.y_min * self.scale_y), - self.rooms_z_min]
+                self.width = int((self.x_max - self.x_min) * self.scale_x)
+                self.height = int((self.y_max - self.y_min) * self.scale_y)
+            else:
+                self.width = self.target_width
+                self.height = self.target_height
 
-                self.compute_trans()
+            self.trans = [- int(self.x_min * self.scale_x), - int(self.y_min * self.scale_y), - self.rooms_z_min]
 
-            for room in self.room_list:
-                room.update_trans(trans_root, self.scale_x, self.scale_y, self.trans)
+            self.compute_trans()
 
     def create_label_channel(self, label):
         self.is_valid = False
-
-        self.update_trans("Level", None, None, None)
+        label_row = self.label_row
+        self.label_row = None
 
         if not self.is_empty:
-            if label.channel_num == 1:
-                self.label_channel = np.zeros((self.height, self.width), label.number_type)
-            else:
-                self.label_channel = np.zeros((self.height, self.width, label.channel_num), label.number_type)
+            if "Level" in label.built_scope_list:
+                self.update_scope_trans()
 
-            valid_node_num = 0
+                valid_node_num = create_scope_label(self, "Level", label)
 
-            for room in self.room_list:
-                for node in room.node_list:
-                    label_index = label.get_label_index(node.label)
-                    if label_index is not None:
-                        cv2.rectangle(self.label_channel, (node.trans_x_min, node.trans_y_min), (node.trans_x_max, node.trans_y_max), label.color_list[label_index], -1)
-                        valid_node_num += 1
-
-            if valid_node_num >= label.min_node_num:
-                self.is_valid = True
+                if valid_node_num >= label.min_node_num:
+                    self.is_valid = True
+            else:
+                self.label_channel = None
+                self.label_rect_array = None
 
             for room in self.room_list:
                 room.create_label_channel(label)
 
         if self.is_valid:
-            label.save_label_channel("Level", self.label_channel, self.id)
+            label.save_label_channel("Level", self.label_channel, self.id, self.node_end - self.node_start, valid_node_num, self.label_count)
+            self.label_row = label.store_label_channel(self.label_channel, label_row)
+        self.label_count = None
 
-        if label.free_label:
+        if label.free_label or label.sparse_label:
             self.label_channel = None
+        elif label.pack_binary and self.label_channel is not None:
+            self.label_channel = label.pack_label_channel(self.label_channel)
+        if label.free_label:
+            self.label_rect_array = None
 
 
 class House:
@@ -292,6 +757,9 @@ class House:
 
         self.levels_z_min = None
         self.level_list = []
+        self.node_array = None
+        self.node_start = 0
+        self.node_end = 0
         self.scale_x = None
         self.scale_y = None
         self.trans = None
@@ -302,12 +770,19 @@ class House:
         self.y_index = None
         self.z_index = None
 
-        self.json = None
-
         self.is_empty = True
         self.is_valid = False
 
+        # rooms without a level and nodes without a room in the house.json
+        self.dropped_room_num = 0
+        self.dropped_node_num = 0
+
         self.label_channel = None
+        # rows of create_node_rect_array when the label is sparse
+        self.label_rect_array = None
+        # nodes per label index of a label channel that is saved to npy
+        self.label_count = None
+        self.label_row = None
 
     def add_node(self, node):
         for level in self.level_list:
@@ -350,27 +825,32 @@ class House:
     def update_trans(self, trans_root):
         if not self.is_empty:
             if trans_root == "House":
-                self.scale_x = self.target_width / (self.x_max - self.x_min)
-                self.scale_y = self.target_height / (self.y_max - self.y_min)
+                self.update_scope_trans()
 
-                if not self.size_fixed:
-                    if self.scale_y < self.scale_x:
-                        self.scale_x = self.scale_y
-                    else:
-                        self.scale_y = self.scale_x
+            for level in self.level_list:
+                level.update_trans(trans_root, self.scale_x, self.scale_y, self.trans)
+
+    def update_scope_trans(self):
+        # the transform of the house label channel, the levels and rooms are not changed
+        if not self.is_empty:
+            self.scale_x = self.target_width / (self.x_max - self.x_min)
+            self.scale_y = self.target_height / (self.y_max - self.y_min)
 
-                    self.width = int((self.x_max - self.x_min) * self.scale_x)
-                    self.height = int((self.y_max - self.y_min) * self.scale_y)
+            if not self.size_fixed:
+                if self.scale_y < self.scale_x:
+                    self.scale_x = self.scale_y
                 else:
-                    self.width = self.target_width
-                    self.height = self.target_height
+                    self.scale_y = self.scale_x
 
-                self.trans = [- int(self.x_min * self.scale_x), - int(self.y_min * self.scale_y), - self.levels_z_min]
+                self.width = int((self.x_max - self.x_min) * self.scale_x)
+                self.height = int((self.y_max - self.y_min) * self.scale_y)
+            else:
+                self.width = self.target_width
+                self.height = self.target_height
 
-                self.compute_trans()
+            self.trans = [- int(self.x_min * self.scale_x), - int(self.y_min * self.scale_y), - self.levels_z_min]
 
-            for level in self.level_list:
-                level.update_trans(trans_root, self.scale_x, self.scale_y, self.trans)
+            self.compute_trans()
 
     def load_bbox(self, json_dict):
         x_min = json_dict["bbox"]["min"][self.x_index]
@@ -385,10 +865,11 @@ class House:
         return x_min, x_max, y_min, y_max, z_min, z_max
 
     def load_json(self, json_file_path):
-        with open(json_file_path, "r") as f:
-            self.json = json.load(f)
+        # only the bboxes and modelIds are kept, the parsed dict is dropped when this returns
+        self.load_json_dict(load_house_json(json_file_path))
 
-        up = self.json["up"]
+    def load_json_dict(self, json_dict):
+        up = json_dict["up"]
 
         if up[0] == 1:
             self.x_index = 1
@@ -403,29 +884,30 @@ class House:
             self.y_index = 1
             self.z_index = 2
 
-        self.x_min, self.x_max, self.y_min, self.y_max, self.z_min, self.z_max = self.load_bbox(self.json)
+        self.x_min, self.x_max, self.y_min, self.y_max, self.z_min, self.z_max = self.load_bbox(json_dict)
 
-        if "levels" in self.json:
-            for level in self.json["levels"]:
+        level_bbox_list = []
+        # number of levels added when each room is read, only those levels are candidates like in add_room
+        room_bbox_list = []
+        room_time_list = []
+        # number of rooms read when each node is read, only those rooms are candidates like in add_node
+        node_bbox_list = []
+        node_label_list = []
+        node_time_list = []
+
+        if "levels" in json_dict:
+            for level in json_dict["levels"]:
                 if "bbox" not in level:
                     continue
 
-                level_x_min, level_x_max, level_y_min, level_y_max, level_z_min, level_z_max = self.load_bbox(level)
-
-                current_level = Level(level_x_min, level_x_max, level_y_min, level_y_max, level_z_min, level_z_max, self.target_width, self.target_height, self.size_fixed)
-
-                self.add_level(current_level)
+                level_bbox_list.append(self.load_bbox(level))
 
                 if "nodes" in level:
                     for node in level["nodes"]:
                         if "valid" in node and "type" in node:
                             if node["valid"] == 1 and node["type"] == "Room":
-
-                                room_x_min, room_x_max, room_y_min, room_y_max, room_z_min, room_z_max = self.load_bbox(node)
-
-                                current_room = Room(room_x_min, room_x_max, room_y_min, room_y_max, room_z_min, room_z_max, self.target_width, self.target_height, self.size_fixed)
-
-                                self.add_room(current_room)
+                                room_bbox_list.append(self.load_bbox(node))
+                                room_time_list.append(len(level_bbox_list))
 
                     for node in level["nodes"]:
                         if "valid" in node and "type" in node:
@@ -433,44 +915,684 @@ class House:
                                 if "modelId" not in node:
                                     continue
 
-                                node_x_min, node_x_max, node_y_min, node_y_max, node_z_min, node_z_max = self.load_bbox(node)
+                                node_bbox_list.append(self.load_bbox(node))
+                                node_label_list.append(node["modelId"])
+                                node_time_list.append(len(room_bbox_list))
+
+        self.create_hierarchy(level_bbox_list, room_bbox_list, room_time_list, node_bbox_list, node_label_list, node_time_list)
+
+    def create_hierarchy(self, level_bbox_list, room_bbox_list, room_time_list, node_bbox_list, node_label_list, node_time_list):
+        for level_bbox in level_bbox_list:
+            self.add_level(Level(*level_bbox, self.target_width, self.target_height, self.size_fixed))
 
-                                current_node = Node(node_x_min, node_x_max, node_y_min, node_y_max, node_z_min, node_z_max, node["modelId"])
+        level_index = ContainerIndex(np.array(level_bbox_list, np.float64).reshape(-1, 6), np.arange(len(level_bbox_list)))
+        room_level_array = level_index.find(np.array(room_bbox_list, np.float64).reshape(-1, 6), np.array(room_time_list, np.int64))
 
-                                self.add_node(current_node)
+        for i in range(len(room_bbox_list)):
+            if room_level_array[i] >= 0:
+                self.level_list[room_level_array[i]].add_room(Room(*room_bbox_list[i], self.target_width, self.target_height, self.size_fixed))
+
+        # add_node checks the rooms level by level, so the containers follow the order of the level room lists
+        room_read_index_array = np.nonzero(room_level_array >= 0)[0]
+        room_read_index_array = room_read_index_array[np.argsort(room_level_array[room_read_index_array], kind="stable")]
+
+        room_bbox_array = np.array(room_bbox_list, np.float64).reshape(-1, 6)[room_read_index_array]
+        room_index = ContainerIndex(room_bbox_array, room_read_index_array)
+
+        node_bbox_array = np.array(node_bbox_list, np.float64).reshape(-1, 6)
+        node_room_array = room_index.find(node_bbox_array, np.array(node_time_list, np.int64))
+
+        node_index_array = np.nonzero(node_room_array >= 0)[0]
+        node_index_array = node_index_array[np.argsort(node_room_array[node_index_array], kind="stable")]
+
+        self.dropped_room_num = len(room_bbox_list) - room_read_index_array.shape[0]
+        self.dropped_node_num = len(node_bbox_list) - node_index_array.shape[0]
+
+        model_id_list = []
+        model_index_dict = {}
+        model_index_list = []
+        for node_index in node_index_array.tolist():
+            model_index = model_index_dict.get(node_label_list[node_index])
+            if model_index is None:
+                model_index = len(model_id_list)
+                model_index_dict[node_label_list[node_index]] = model_index
+                model_id_list.append(node_label_list[node_index])
+            model_index_list.append(model_index)
+
+        node_array = NodeArray(node_bbox_array[node_index_array], np.array(model_index_list, np.int32), model_id_list)
+
+        self.set_node_array(node_array, np.bincount(node_room_array[node_index_array], minlength=room_read_index_array.shape[0]).tolist())
+
+    def has_new_node(self):
+        for level in self.level_list:
+            for room in level.room_list:
+                if len(room.new_node_list) > 0:
+                    return True
+
+        return False
+
+    def set_node_array(self, node_array, room_node_num_list):
+        node_start = 0
+        room_index = 0
+
+        for level in self.level_list:
+            level.node_array = node_array
+            level.node_start = node_start
+
+            for room in level.room_list:
+                room.node_array = node_array
+                room.new_node_list = []
+                room.node_start = node_start
+                node_start += room_node_num_list[room_index]
+                room.node_end = node_start
+                room_index += 1
+
+                if room.node_end > room.node_start:
+                    room.nodes_z_min = float(node_array.bbox_array[room.node_start:room.node_end, 4].min())
+                    room.is_empty = False
+                    level.is_empty = False
+                    self.is_empty = False
+
+            level.node_end = node_start
+
+        self.node_array = node_array
+        self.node_start = 0
+        self.node_end = node_start
+
+    def create_node_array(self):
+        bbox_list = []
+        model_index_list = []
+        model_id_list = []
+        model_index_dict = {}
+        room_node_num_list = []
+
+        for level in self.level_list:
+            for room in level.room_list:
+                node_list = room.node_list
+                room_node_num_list.append(len(node_list))
+
+                for node in node_list:
+                    bbox_list.append([node.x_min, node.x_max, node.y_min, node.y_max, node.z_min, node.z_max])
+
+                    model_index = model_index_dict.get(node.label)
+                    if model_index is None:
+                        model_index = len(model_id_list)
+                        model_index_dict[node.label] = model_index
+                        model_id_list.append(node.label)
+                    model_index_list.append(model_index)
+
+        node_array = NodeArray(np.array(bbox_list, np.float64).reshape(-1, 6), np.array(model_index_list, np.int32), model_id_list)
+
+        self.set_node_array(node_array, room_node_num_list)
+
+    def copy(self, target_width, target_height):
+        # same hierarchy for another target size, the NodeArray is shared
+        if self.node_array is None or self.has_new_node():
+            self.create_node_array()
+
+        house = House(self.json_id, target_width, target_height, self.size_fixed)
+        house.x_index = self.x_index
+        house.y_index = self.y_index
+        house.z_index = self.z_index
+        house.x_min, house.x_max, house.y_min, house.y_max, house.z_min, house.z_max = self.x_min, self.x_max, self.y_min, self.y_max, self.z_min, self.z_max
+        house.dropped_room_num = self.dropped_room_num
+        house.dropped_node_num = self.dropped_node_num
+
+        room_node_num_list = []
+        for level in self.level_list:
+            new_level = Level(level.x_min, level.x_max, level.y_min, level.y_max, level.z_min, level.z_max, target_width, target_height, self.size_fixed)
+            house.add_level(new_level)
+
+            for room in level.room_list:
+                new_level.add_room(Room(room.x_min, room.x_max, room.y_min, room.y_max, room.z_min, room.z_max, target_width, target_height, self.size_fixed))
+                room_node_num_list.append(room.node_end - room.node_start)
+
+        house.set_node_array(self.node_array, room_node_num_list)
+
+        return house
+
+    def save_cache(self, cache_file_path, json_stat):
+        if self.node_array is None or self.has_new_node():
+            self.create_node_array()
+
+        level_bbox_list = []
+        room_bbox_list = []
+        room_level_list = []
+        node_room_list = []
+
+        for level in self.level_list:
+            level_bbox_list.append([level.x_min, level.x_max, level.y_min, level.y_max, level.z_min, level.z_max])
+            for room in level.room_list:
+                room_level_list.append(len(level_bbox_list) - 1)
+                room_bbox_list.append([room.x_min, room.x_max, room.y_min, room.y_max, room.z_min, room.z_max])
+                node_room_list += [len(room_bbox_list) - 1] * (room.node_end - room.node_start)
+
+        node_label = np.array(self.node_array.model_id_list, np.str_)[self.node_array.model_index_array]
+
+        temp_cache_file_path = cache_file_path + ".tmp"
+        with open(temp_cache_file_path, "wb") as f:
+            np.savez(f,
+                    key=np.array(json_stat),
+                    axis_index=np.array([self.x_index, self.y_index, self.z_index], np.int64),
+                    house_bbox=np.array([self.x_min, self.x_max, self.y_min, self.y_max, self.z_min, self.z_max], np.float64),
+                    level_bbox=np.array(level_bbox_list, np.float64).reshape(-1, 6),
+                    room_bbox=np.array(room_bbox_list, np.float64).reshape(-1, 6),
+                    room_level=np.array(room_level_list, np.int64),
+                    node_bbox=self.node_array.bbox_array,
+                    node_room=np.array(node_room_list, np.int64),
+                    node_label=node_label,
+                    dropped_num=np.array([self.dropped_room_num, self.dropped_node_num], np.int64))
+        os.replace(temp_cache_file_path, cache_file_path)
+
+    def load_cache(self, cache_file_path, json_stat):
+        if not os.path.exists(cache_file_path):
+            return False
+
+        try:
+            with np.load(cache_file_path) as cache:
+                if cache["key"].tolist() != json_stat:
+                    return False
+
+                self.x_index, self.y_index, self.z_index = cache["axis_index"].tolist()
+                self.x_min, self.x_max, self.y_min, self.y_max, self.z_min, self.z_max = cache["house_bbox"].tolist()
+
+                level_bbox_list = cache["level_bbox"].tolist()
+                room_bbox_list = cache["room_bbox"].tolist()
+                room_level_list = cache["room_level"].tolist()
+                node_bbox = cache["node_bbox"]
+                node_room = cache["node_room"]
+                node_label = cache["node_label"]
+                self.dropped_room_num, self.dropped_node_num = cache["dropped_num"].tolist()
+        except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+            # an empty or truncated cache file is parsed again from the json
+            return False
+
+        for level_bbox in level_bbox_list:
+            self.add_level(Level(*level_bbox, self.target_width, self.target_height, self.size_fixed))
+
+        for i in range(len(room_bbox_list)):
+            room = Room(*room_bbox_list[i], self.target_width, self.target_height, self.size_fixed)
+            self.level_list[room_level_list[i]].add_room(room)
+
+        model_id_array, model_index_array = np.unique(node_label, return_inverse=True)
+        node_array = NodeArray(node_bbox, model_index_array.astype(np.int32), model_id_array.tolist())
+
+        # nodes are saved room by room, so each room is one contiguous range
+        self.set_node_array(node_array, np.bincount(node_room, minlength=len(room_bbox_list)).tolist())
+
+        return True
 
     def create_label_channel(self, label):
         self.is_valid = False
+        label_row = self.label_row
+        self.label_row = None
 
-        self.update_trans("House")
+        if self.node_array is None or self.has_new_node():
+            self.create_node_array()
 
+        # each scope only needs its own transform, scopes that are not built are skipped
         if not self.is_empty:
-            if label.channel_num == 1:
-                self.label_channel = np.zeros((self.height, self.width), label.number_type)
-            else:
-                self.label_channel = np.zeros((self.height, self.width, label.channel_num), label.number_type)
-
-            valid_node_num = 0
+            if "House" in label.built_scope_list:
+                self.update_scope_trans()
 
-            for level in self.level_list:
-                for room in level.room_list:
-                    for node in room.node_list:
-                        label_index = label.get_label_index(node.label)
-                        if label_index is not None:
-                            cv2.rectangle(self.label_channel, (node.trans_x_min, node.trans_y_min), (node.trans_x_max, node.trans_y_max), label.color_list[label_index], -1)
-                            valid_node_num += 1
+                valid_node_num = create_scope_label(self, "House", label)
 
-            if valid_node_num >= label.min_node_num:
-                self.is_valid = True
+                if valid_node_num >= label.min_node_num:
+                    self.is_valid = True
+            else:
+                self.label_channel = None
+                self.label_rect_array = None
 
             for level in self.level_list:
                 level.create_label_channel(label)
 
         if self.is_valid:
-            label.save_label_channel("House", self.label_channel, self.json_id)
+            label.save_label_channel("House", self.label_channel, self.json_id, self.node_end - self.node_start, valid_node_num, self.label_count)
+            self.label_row = label.store_label_channel(self.label_channel, label_row)
+        self.label_count = None
 
-        if label.free_label:
+        if label.free_label or label.sparse_label:
             self.label_channel = None
+        elif label.pack_binary and self.label_channel is not None:
+            self.label_channel = label.pack_label_channel(self.label_channel)
+        if label.free_label:
+            self.label_rect_array = None
+
+
+class NpyWriter:
+    header_size = 256
+
+    def __init__(self, file_path, dtype, resume=False, flat=False):
+        self.file_path = file_path
+        self.dtype = np.dtype(dtype)
+        self.flat = flat
+
+        self.shape = None
+        self.row_size = None
+        self.row_num = 0
+
+        if self.flat:
+            self.shape = ()
+            self.row_size = self.dtype.itemsize
+
+        self.file = None
+
+        if resume and os.path.exists(self.file_path):
+            self.file = open(self.file_path, "r+b")
+            self.load_header()
+        else:
+            self.file = open(self.file_path, "w+b")
+            self.file.write(self.create_header())
+
+    def create_header(self):
+        shape = (self.row_num,)
+        if self.shape is not None:
+            shape += self.shape
+
+        header = "{'descr': %s, 'fortran_order': False, 'shape': %s, }" % (repr(np.lib.format.dtype_to_descr(self.dtype)), repr(shape))
+        header = header.ljust(self.header_size - 11) + "\n"
+
+        return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+    def load_header(self):
+        self.file.seek(0)
+        np.lib.format.read_magic(self.file)
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(self.file)
+
+        if self.file.tell() != self.header_size or fortran_order or dtype != self.dtype:
+            raise ValueError("can not resume " + self.file_path + ", it was not written by NpyWriter with dtype " + str(self.dtype))
+
+        self.row_num = shape[0]
+        if self.row_num > 0 or self.flat:
+            self.shape = shape[1:]
+            self.row_size = int(np.prod(self.shape)) * self.dtype.itemsize
+
+            # drop the rows written after the last flush
+            self.file.truncate(self.header_size + self.row_num * self.row_size)
+
+        self.file.seek(0, 2)
+
+    def write(self, array):
+        array = np.ascontiguousarray(array, self.dtype)
+
+        if self.flat:
+            self.file.write(array.tobytes())
+            self.row_num += array.size
+            return
+
+        if self.shape is None:
+            self.shape = array.shape
+            self.row_size = array.nbytes
+        elif array.shape != self.shape:
+            raise ValueError("all label channels saved in one .npy file must have the same shape, got " + str(array.shape) + " after " + str(self.shape) + ", use size_fixed=True")
+
+        self.file.write(array.tobytes())
+        self.row_num += 1
+
+    def write_rows(self, array):
+        if self.flat:
+            self.write(array)
+            return
+
+        for row in array:
+            self.write(row)
+
+    def truncate(self, row_num):
+        self.row_num = row_num
+        if self.row_num == 0 and not self.flat:
+            self.shape = None
+            self.row_size = None
+
+        row_size = 0
+        if self.row_size is not None:
+            row_size = self.row_size
+        self.file.truncate(self.header_size + self.row_num * row_size)
+        self.flush()
+
+    def flush(self):
+        self.file.seek(0)
+        self.file.write(self.create_header())
+        self.file.seek(0, 2)
+        self.file.flush()
+
+    def close(self):
+        if self.file is None:
+            return
+
+        self.flush()
+        self.file.close()
+        self.file = None
+
+
+def keep_npy_range(file_path, dtype, range_list, flat=False):
+    # keep only the rows in range_list of a file written by NpyWriter, in this order
+    writer = NpyWriter(file_path, dtype, True, flat)
+
+    row_num = 0
+    is_prefix = True
+    for start, end in range_list:
+        if start != row_num:
+            is_prefix = False
+        row_num += end - start
+
+    if is_prefix:
+        writer.truncate(row_num)
+        writer.close()
+        return
+
+    writer.close()
+
+    old_file_path = file_path + ".old"
+    os.replace(file_path, old_file_path)
+
+    old_data = np.load(old_file_path, mmap_mode="r")
+    writer = NpyWriter(file_path, dtype, flat=flat)
+    for start, end in range_list:
+        writer.write_rows(old_data[start:end])
+    writer.close()
+
+    del old_data
+    os.remove(old_file_path)
+
+def write_image(image_file_path, label_channel):
+    # the format follows the extension, .npy keeps the raw array, returns the bytes written
+    with open(image_file_path, "wb") as f:
+        if image_file_path[-4:] == ".npy":
+            np.save(f, label_channel)
+            return f.tell()
+
+        is_encoded, image_buffer = cv2.imencode(os.path.splitext(image_file_path)[1], label_channel)
+        if not is_encoded:
+            raise ValueError("can not encode image : " + image_file_path)
+
+        f.write(image_buffer)
+        return image_buffer.nbytes
+
+class ImageWriter:
+    # threads write the images of a bounded queue, so encoding and disk io overlap the build
+    def __init__(self, thread_num=4, queue_size=64):
+        self.image_queue = queue.Queue(queue_size)
+        self.lock = threading.Lock()
+        self.error_list = []
+        self.written_byte_num = 0
+
+        self.thread_list = []
+        for _ in range(thread_num):
+            thread = threading.Thread(target=self.write_loop, daemon=True)
+            thread.start()
+            self.thread_list.append(thread)
+
+    def write_loop(self):
+        while True:
+            image_info = self.image_queue.get()
+            if image_info is None:
+                self.image_queue.task_done()
+                return
+
+            image_file_path, label_channel = image_info
+
+            try:
+                written_byte_num = write_image(image_file_path, label_channel)
+                with self.lock:
+                    self.written_byte_num += written_byte_num
+            except Exception as e:
+                # keep the thread alive, the errors are raised by flush and close
+                with self.lock:
+                    self.error_list.append(image_file_path + " : " + str(e))
+
+            self.image_queue.task_done()
+
+    def write(self, image_file_path, label_channel):
+        if len(self.thread_list) == 0:
+            raise ValueError("this ImageWriter is closed")
+
+        # blocks while the queue is full
+        self.image_queue.put([image_file_path, label_channel])
+
+    def raise_error(self):
+        with self.lock:
+            error_list = self.error_list
+            self.error_list = []
+
+        if len(error_list) > 0:
+            raise OSError(str(len(error_list)) + " images were not written, first error : " + error_list[0])
+
+    def flush(self):
+        self.image_queue.join()
+        self.raise_error()
+
+    def close(self):
+        for _ in self.thread_list:
+            self.image_queue.put(None)
+        for thread in self.thread_list:
+            thread.join()
+        self.thread_list = []
+
+        self.raise_error()
+
+SHARD_FILE_NAME_PATTERN = re.compile(r"^shard_\d+\.(?:npy|csv)$")
+
+class ShardWriter:
+    # shard_00000.npy, ... of shard_size stacked label channels, each with a .csv telling what every row is
+    # manifest.json lists the shards when the writer is closed
+    def __init__(self, shard_path, dtype, shard_size, packed_width=None):
+        self.shard_path = shard_path
+        self.dtype = dtype
+        self.shard_size = shard_size
+        # width of the label channels when they are saved by pack_label_channel
+        self.packed_width = packed_width
+
+        self.shard_list = []
+        self.row_num = 0
+        self.shape = None
+
+        self.writer = None
+        self.info_file = None
+        self.info_writer = None
+
+        if not os.path.exists(self.shard_path):
+            os.makedirs(self.shard_path)
+
+        # shards of an older build would be mixed with the new ones
+        for file_name in os.listdir(self.shard_path):
+            if SHARD_FILE_NAME_PATTERN.match(file_name) or file_name == "manifest.json":
+                os.remove(self.shard_path + file_name)
+
+    def open_shard(self):
+        self.close_shard()
+
+        shard_name = "shard_%05d" % len(self.shard_list)
+        self.shard_list.append({"data" : shard_name + ".npy", "info" : shard_name + ".csv", "row_num" : 0})
+
+        self.writer = NpyWriter(self.shard_path + shard_name + ".npy", self.dtype)
+        self.info_file = open(self.shard_path + shard_name + ".csv", "w", newline="")
+        self.info_writer = csv.writer(self.info_file)
+        self.info_writer.writerow(["row", "scope", "id", "json_id", "level_index", "room_index", "node_num", "valid_node_num"])
+
+    def close_shard(self):
+        if self.writer is None:
+            return
+
+        self.writer.close()
+        self.info_file.close()
+
+        self.writer = None
+        self.info_file = None
+        self.info_writer = None
+
+    def write(self, object_type, label_channel, id, node_num, valid_node_num):
+        if self.writer is None or self.writer.row_num >= self.shard_size:
+            self.open_shard()
+
+        # ids are json_id, json_id_level and json_id_level_room
+        id_split = id.rsplit("_", ["House", "Level", "Room"].index(object_type))
+        id_split += [-1] * (3 - len(id_split))
+
+        self.info_writer.writerow([self.writer.row_num, object_type, id] + id_split + [node_num, valid_node_num])
+        self.writer.write(label_channel)
+
+        self.shape = list(label_channel.shape)
+        self.shard_list[-1]["row_num"] += 1
+        self.row_num += 1
+
+    def flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+            self.info_file.flush()
+
+    def close(self):
+        self.close_shard()
+
+        manifest = {
+            "dtype" : np.dtype(self.dtype).str,
+            "shape" : self.shape,
+            "shard_size" : self.shard_size,
+            "packed_width" : self.packed_width,
+            "row_num" : self.row_num,
+            "shard_list" : self.shard_list
+        }
+
+        temp_manifest_file_path = self.shard_path + "manifest.json.tmp"
+        with open(temp_manifest_file_path, "w") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(temp_manifest_file_path, self.shard_path + "manifest.json")
+
+class ShardReader:
+    # reads whole shards in order, each reader of a distributed job takes every world_size-th shard
+    def __init__(self, shard_path):
+        self.shard_path = shard_path
+        if self.shard_path[-1] != "/":
+            self.shard_path += "/"
+
+        with open(self.shard_path + "manifest.json", "r") as f:
+            self.manifest = json.load(f)
+
+        self.shard_list = self.manifest["shard_list"]
+
+    def get_shard_index_list(self, rank=0, world_size=1):
+        if rank < 0 or rank >= world_size:
+            raise ValueError("rank must be in [0, " + str(world_size) + "), got " + str(rank))
+
+        return list(range(rank, len(self.shard_list), world_size))
+
+    def load_shard(self, shard_index, mmap_mode=None, unpack=False):
+        shard = self.shard_list[shard_index]
+
+        label_channel_array = np.load(self.shard_path + shard["data"], mmap_mode=mmap_mode)
+
+        # packed shards are unpacked to 0 and 1
+        packed_width = self.manifest.get("packed_width")
+        if unpack and packed_width is not None:
+            label_channel_array = unpack_label_channel(label_channel_array, packed_width, keep_channel=len(self.manifest["shape"]) == 3)
+
+        info_list = []
+        with open(self.shard_path + shard["info"], "r", newline="") as f:
+            reader = csv.reader(f)
+            next(reader)
+            for row in reader:
+                info_list.append([int(row[0]), row[1], row[2], row[3], int(row[4]), int(row[5]), int(row[6]), int(row[7])])
+
+        return label_channel_array, info_list
+
+    def iter_shard(self, rank=0, world_size=1, mmap_mode=None, unpack=False):
+        for shard_index in self.get_shard_index_list(rank, world_size):
+            yield self.load_shard(shard_index, mmap_mode, unpack)
+
+class LabelStore:
+    scope_list = ["House", "Level", "Room"]
+
+    def __init__(self, store_path, number_type=np.uint8, mode="r", resume=False):
+        self.store_path = store_path
+        self.number_type = number_type
+        self.mode = mode
+
+        self.data_file_path = None
+        self.index_file_path = None
+
+        # write mode : [offset, height, width, channel_num] of each stored label channel
+        self.row_list = []
+        # write mode without store_path : label channels kept in memory, e.g. inside a worker process
+        self.label_channel_list = []
+        self.writer = None
+
+        self.data = None
+        self.index = None
+        self.index_dict = None
+
+        if self.store_path is not None:
+            if self.store_path[-1] != "/":
+                self.store_path += "/"
+            self.data_file_path = self.store_path + "label_channel.npy"
+            self.index_file_path = self.store_path + "label_index.npy"
+
+        if self.mode == "w":
+            if self.store_path is not None:
+                if not os.path.exists(self.store_path):
+                    os.makedirs(self.store_path)
+                self.writer = NpyWriter(self.data_file_path, self.number_type, resume, True)
+        else:
+            self.load()
+
+    def write(self, label_channel):
+        if self.writer is None:
+            self.label_channel_list.append(label_channel)
+            return len(self.label_channel_list) - 1
+
+        channel_num = 1
+        if label_channel.ndim == 3:
+            channel_num = label_channel.shape[2]
+
+        self.row_list.append([self.writer.row_num, label_channel.shape[0], label_channel.shape[1], channel_num])
+        self.writer.write(label_channel)
+        return len(self.row_list) - 1
+
+    def save_index(self, key_list):
+        index = np.zeros((len(self.row_list), 8), np.int64)
+        if len(self.row_list) > 0:
+            index[:, 4:] = self.row_list
+
+        for scope, house_index, level_index, room_index, row in key_list:
+            index[row, :4] = [self.scope_list.index(scope), house_index, level_index, room_index]
+
+        self.writer.close()
+        self.writer = None
+
+        np.save(self.index_file_path, index)
+
+    def load(self):
+        self.data = np.load(self.data_file_path, mmap_mode="r")
+        self.index = np.load(self.index_file_path)
+
+    def get_row(self, trans_root, house_index, level_index=-1, room_index=-1):
+        if self.index_dict is None:
+            self.index_dict = {}
+            for row in range(self.index.shape[0]):
+                self.index_dict[tuple(self.index[row, :4].tolist())] = row
+
+        return self.index_dict.get((self.scope_list.index(trans_root), house_index, level_index, room_index))
+
+    def get_label_channel_array(self):
+        # only possible when all the label channels have the same shape, e.g. with size_fixed=True
+        if self.index.shape[0] == 0:
+            return None
+
+        shape = self.index[0, 5:]
+        if not np.all(self.index[:, 5:] == shape):
+            return None
+
+        height, width, channel_num = shape.tolist()
+        if channel_num == 1:
+            return self.data.reshape(-1, height, width)
+        return self.data.reshape(-1, height, width, channel_num)
+
+    def get_label_channel(self, row):
+        offset, height, width, channel_num = self.index[row, 4:].tolist()
+
+        label_channel = self.data[offset:offset + height * width * channel_num]
+
+        if channel_num == 1:
+            return label_channel.reshape(height, width)
+        return label_channel.reshape(height, width, channel_num)
 
 
 class Label:
@@ -484,7 +1606,14 @@ class Label:
                 channel_num,
                 use_color,
                 free_label,
-                number_type
+                number_type,
+                label_store_path=None,
+                shard_size=0,
+                label_scope_list=None,
+                sparse_label=False,
+                pack_binary=False,
+                one_hot=False,
+                one_hot_overlap="last"
                 ):
         self.label_file_path = label_file_path
         self.valid_label_list = valid_label_list
@@ -496,21 +1625,70 @@ class Label:
         self.use_color = use_color
         self.free_label = free_label
         self.number_type = number_type
+        self.label_store_path = label_store_path
+        # > 0 to save the label channels of a save_path folder in shards of this many rows
+        self.shard_size = shard_size
+        # scopes to build label channels for, None for the ones that are saved, stored or kept
+        self.label_scope_list = label_scope_list
+        self.built_scope_list = []
+        # keep the rectangles of each label channel and paint them when they are sampled
+        self.sparse_label = sparse_label
+        # keep and save binary label channels with pack_label_channel, images and the label store are not packed
+        self.pack_binary = pack_binary
+        # one channel per valid label, channel_num must be len(valid_label_list)
+        self.one_hot = one_hot
+        # last keeps the label painted last at each pixel like the other label channels, any keeps all of them
+        self.one_hot_overlap = one_hot_overlap
 
         self.save_as_npy = False
 
         self.csv_data = []
+        self.model_info_dict = {}
+        self.model_label_dict = {}
 
         self.color_list = []
+        self.color_array = None
 
         self.label_array = []
+        self.label_writer = None
+        self.label_count_writer = None
+        self.label_store = None
+        # False while restoring the label channels of houses that are already saved
+        self.save_enabled = True
+        # BuildStats of the database build, None when it is not measured
+        self.stats = None
+        # jpg, png or npy when save_path is a folder, only png and npy keep the label indices
+        self.image_format = "jpg"
+        self.image_writer = None
+        self.shard_writer = None
 
         self.load_label()
 
+        # None builds the label index channels of every label in the csv, create_remap_lut derives other label sets from them
+        if self.valid_label_list is None:
+            self.valid_label_list = get_label_vocabulary(self.csv_data)
+
+        self.create_label_dict()
+
         self.create_color()
 
         self.create_save_path()
 
+        self.update_built_scope_list()
+
+    def update_built_scope_list(self):
+        if self.label_scope_list is not None:
+            scope_list = self.label_scope_list
+        elif not self.free_label or self.label_store_path is not None:
+            scope_list = ["House", "Level", "Room"]
+        else:
+            scope_list = self.save_object
+
+        self.built_scope_list = []
+        for scope in ["House", "Level", "Room"]:
+            if scope in scope_list:
+                self.built_scope_list.append(scope)
+
     def load_label(self):
         self.csv_data = []
 
@@ -520,6 +1698,14 @@ class Label:
             for row in reader:
                 self.csv_data.append(row)
 
+    def create_label_dict(self):
+        self.model_info_dict = {}
+        for line in self.csv_data:
+            if line[1] not in self.model_info_dict:
+                self.model_info_dict[line[1]] = line
+
+        self.model_label_dict = create_model_label_dict(self.csv_data, self.valid_label_list)
+
     def create_color(self):
         color_black = []
         for i in range(self.channel_num):
@@ -531,7 +1717,15 @@ class Label:
 
         for i in range(len(self.valid_label_list)):
             label_color = []
-            if self.is_binary:
+            if self.one_hot:
+                for j in range(self.channel_num):
+                    if j != i:
+                        label_color.append(0)
+                    elif self.use_color:
+                        label_color.append(255)
+                    else:
+                        label_color.append(1)
+            elif self.is_binary:
                 if self.use_color:
                     for j in range(self.channel_num):
                         label_color.append(255)
@@ -549,6 +1743,63 @@ class Label:
             else:
                 self.color_list.append(tuple(label_color))
 
+        if not self.is_binary and not self.use_color and not self.one_hot and np.issubdtype(np.dtype(self.number_type), np.integer):
+            if len(self.valid_label_list) > np.iinfo(self.number_type).max:
+                raise ValueError("number_type " + str(np.dtype(self.number_type)) + " can not hold " + str(len(self.valid_label_list)) + " label indices")
+
+        self.update_color_array()
+
+    def create_remap_lut(self, valid_label_list, is_binary=False, use_color=False, channel_num=1, one_hot=False):
+        # lut[label_channel] gives the label channels of another label set, the geometry and the paint order are not changed
+        # so a pixel where a label that is dropped was painted over a kept one becomes 0
+        # min_node_num is only checked again by remap_npy with create_remap_index
+        if self.is_binary or self.use_color or self.one_hot or self.channel_num != 1:
+            raise ValueError("only label index channels can be remapped, use is_binary=False, use_color=False and channel_num=1")
+
+        target_label = copy.copy(self)
+        target_label.valid_label_list = valid_label_list
+        target_label.is_binary = is_binary
+        target_label.use_color = use_color
+        target_label.channel_num = channel_num
+        target_label.one_hot = one_hot
+        if one_hot:
+            target_label.channel_num = len(valid_label_list)
+        target_label.color_list = []
+        target_label.create_color()
+
+        return target_label.color_array[self.create_remap_index(valid_label_list)]
+
+    def create_remap_index(self, valid_label_list):
+        # the label index of valid_label_list for each label index of this label, 0 for the labels that are dropped
+        label_index_dict = {}
+        for i in range(len(valid_label_list)):
+            if valid_label_list[i] not in label_index_dict:
+                label_index_dict[valid_label_list[i]] = i + 1
+
+        label_index_list = [0]
+        for label in self.valid_label_list:
+            label_index_list.append(label_index_dict.get(label, 0))
+
+        return np.array(label_index_list, np.int64)
+
+    def set_color_list(self, color_list):
+        self.color_list = []
+        for color in color_list:
+            if self.channel_num == 1:
+                self.color_list.append(color)
+            else:
+                self.color_list.append(tuple(color))
+
+        self.update_color_array()
+
+    def update_color_array(self):
+        # saturate like cv2 does when painting into integer label channels
+        color_array = np.array(self.color_list, np.float64)
+        if np.issubdtype(np.dtype(self.number_type), np.integer):
+            number_info = np.iinfo(self.number_type)
+            color_array = np.clip(color_array, number_info.min, number_info.max)
+        self.color_array = color_array.astype(self.number_type)
+
     def create_save_path(self):
         if self.save_path[-4:] == ".npy":
             save_path_split = self.save_path.split("/")
@@ -559,50 +1810,478 @@ class Label:
             self.save_as_npy = True
         elif not os.path.exists(self.save_path):
             os.makedirs(self.save_path)
+
+        if self.shard_size > 0:
+            return
+
         for object_type in self.save_object:
             if not os.path.exists(self.save_path + object_type + "/"):
                 os.makedirs(self.save_path + object_type + "/")
 
     def is_label_valid(self, label_info):
-        if self.valid_label_list is None:
-            return True
-
         if label_info[3] in self.valid_label_list:
             return True
 
         return False
 
     def get_label_info(self, label):
-        for line in self.csv_data:
-            if line[1] == label:
-                if self.is_label_valid(line):
-                    return line
+        line = self.model_info_dict.get(label)
+
+        if line is None:
+            return None
 
-                return None
+        if self.is_label_valid(line):
+            return line
 
         return None
 
     def get_label_index(self, label):
-        label_info = self.get_label_info(label)
+        return self.model_label_dict.get(label)
+
+    def get_save_dtype(self):
+        if self.pack_binary:
+            return np.uint8
+
+        return self.number_type
+
+    def get_packed_color(self):
+        # the color of every valid label of a binary label, or the value of a one hot channel
+        if self.one_hot:
+            return self.color_array[-1].max()
+
+        return self.color_array[-1]
 
-        if label_info is None:
-            return None
+    def is_channel_packed(self):
+        # one hot channels are different, so all of them are packed
+        return self.one_hot and self.channel_num > 1
+
+    def pack_label_channel(self, label_channel):
+        return pack_label_channel(label_channel, self.is_channel_packed())
+
+    def unpack_label_channel(self, packed_array, width, out=None):
+        return unpack_label_channel(packed_array, width, self.get_packed_color(), out, self.is_channel_packed())
+
+    def get_label_index_array(self, label_list):
+        # 0 marks the labels that are not valid
+        label_index_list = []
+        for label in label_list:
+            label_index = self.model_label_dict.get(label)
+            if label_index is None:
+                label_index = 0
+            label_index_list.append(label_index)
+
+        return np.array(label_index_list, np.int64)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["label_writer"] = None
+        state["label_count_writer"] = None
+        state["label_store"] = None
+        state["image_writer"] = None
+        state["shard_writer"] = None
+        return state
+
+    def open_label_writer(self, resume=False):
+        self.close_label_writer()
+        self.label_writer = NpyWriter(self.save_path, self.get_save_dtype(), resume)
+        self.label_count_writer = NpyWriter(get_label_count_path(self.save_path), np.int32, resume)
+
+    def flush_label_writer(self):
+        if self.label_writer is not None:
+            self.label_writer.flush()
+            self.label_count_writer.flush()
+        if self.label_store is not None and self.label_store.writer is not None:
+            self.label_store.writer.flush()
+        if self.shard_writer is not None:
+            self.shard_writer.flush()
+
+    def close_label_writer(self):
+        if self.label_writer is not None:
+            self.label_writer.close()
+            self.label_writer = None
+            self.label_count_writer.close()
+            self.label_count_writer = None
+
+    def open_shard_writer(self, packed_width=None):
+        self.close_shard_writer()
+        self.shard_writer = ShardWriter(self.save_path, self.get_save_dtype(), self.shard_size, packed_width)
 
-        label_index = 1
+    def close_shard_writer(self):
+        if self.shard_writer is not None:
+            self.shard_writer.close()
+            self.shard_writer = None
 
-        for valid_label in self.valid_label_list:
-            if label_info[3] == valid_label:
-                return label_index
+    def open_image_writer(self, thread_num, queue_size):
+        self.close_image_writer()
+        self.image_writer = ImageWriter(thread_num, queue_size)
 
-            label_index += 1
+    def flush_image_writer(self):
+        if self.image_writer is not None:
+            self.image_writer.flush()
+
+    def close_image_writer(self):
+        if self.image_writer is None:
+            return
+
+        image_writer = self.image_writer
+        self.image_writer = None
+
+        image_writer.close()
+
+        if self.stats is not None:
+            self.stats.add_count("saved_bytes", image_writer.written_byte_num)
+
+    def open_label_store(self, store_path, resume=False):
+        self.label_store = LabelStore(store_path, self.number_type, "w", resume)
+
+    def store_label_channel(self, label_channel, label_row=None):
+        # without an open label store, e.g. when the label channels are created again after the build, the saved row is kept
+        if self.label_store is None or not self.save_enabled:
+            return label_row
+
+        if self.stats is None:
+            return self.label_store.write(label_channel)
+
+        start_time = perf_counter()
+
+        row = self.label_store.write(label_channel)
+
+        self.stats.add_time("save", start_time)
+        if self.label_store.writer is not None:
+            self.stats.add_count("saved_bytes", label_channel.nbytes)
+
+        return row
+
+    def save_label_channel(self, object_type, label_channel, id, node_num=0, valid_node_num=0, label_count=None):
+        if not self.save_enabled:
+            return
 
-    def save_label_channel(self, object_type, label_channel, id):
         if object_type in self.save_object:
             if self.save_path is not None:
-                if self.save_as_npy:
-                    self.label_array.append(label_channel)
+                if self.stats is not None:
+                    start_time = perf_counter()
+
+                saved_byte_num = 0
+
+                if self.save_as_npy or self.shard_size > 0:
+                    if self.pack_binary and (self.label_writer is not None or self.shard_writer is not None):
+                        label_channel = self.pack_label_channel(label_channel)
+
+                    if self.label_writer is not None:
+                        self.label_writer.write(label_channel)
+                        self.label_count_writer.write(label_count)
+                        saved_byte_num = label_channel.nbytes
+                    elif self.shard_writer is not None:
+                        self.shard_writer.write(object_type, label_channel, id, node_num, valid_node_num)
+                        saved_byte_num = label_channel.nbytes
+                    else:
+                        # in a worker process, the parent saves it again with these args
+                        self.label_array.append([object_type, label_channel, id, node_num, valid_node_num, label_count])
+                else:
+                    image_file_path = self.save_path + object_type + "/" + id + "." + self.image_format
+                    if self.image_writer is not None:
+                        self.image_writer.write(image_file_path, label_channel)
+                    else:
+                        saved_byte_num = write_image(image_file_path, label_channel)
+
+                if self.stats is not None:
+                    self.stats.add_time("save", start_time)
+                    self.stats.add_count("saved_bytes", saved_byte_num)
+
+
+class BuildStats:
+    # wall time of the build stages summed over all houses, and counts of what was built
+    # houses that take at least slow_house_time seconds in these stages are kept with their stage times
+    def __init__(self, slow_house_time=None):
+        self.slow_house_time = slow_house_time
+
+        self.stage_time_dict = {}
+        self.count_dict = {}
+        self.house_stage_time_dict = {}
+        self.slow_house_list = []
+
+    def add_time(self, stage, start_time):
+        run_time = perf_counter() - start_time
+        self.stage_time_dict[stage] = self.stage_time_dict.get(stage, 0.0) + run_time
+        self.house_stage_time_dict[stage] = self.house_stage_time_dict.get(stage, 0.0) + run_time
+
+    def add_count(self, name, num=1):
+        self.count_dict[name] = self.count_dict.get(name, 0) + num
+
+    def add_stats(self, stats):
+        # stats of one house measured in a worker
+        for stage, run_time in stats.stage_time_dict.items():
+            self.stage_time_dict[stage] = self.stage_time_dict.get(stage, 0.0) + run_time
+            self.house_stage_time_dict[stage] = self.house_stage_time_dict.get(stage, 0.0) + run_time
+        for name, num in stats.count_dict.items():
+            self.add_count(name, num)
+
+    def add_house(self, house):
+        self.add_count("houses")
+        self.add_count("levels", len(house.level_list))
+        self.add_count("nodes", house.node_end - house.node_start)
+        self.add_count("dropped_rooms", house.dropped_room_num)
+        self.add_count("dropped_nodes", house.dropped_node_num)
+
+        if house.is_valid:
+            self.add_count("valid_houses")
+
+        for level in house.level_list:
+            self.add_count("rooms", len(level.room_list))
+            if level.is_valid:
+                self.add_count("valid_levels")
+
+            for room in level.room_list:
+                if room.is_valid:
+                    self.add_count("valid_rooms")
                 else:
-                    cv2.imwrite(self.save_path + object_type + "/" + id + ".jpg", label_channel)
+                    self.add_count("invalid_rooms")
+
+    def finish_house(self, json_id):
+        house_time = sum(self.house_stage_time_dict.values())
+
+        if self.slow_house_time is not None and house_time >= self.slow_house_time:
+            self.slow_house_list.append({
+                "json_id" : json_id,
+                "seconds" : house_time,
+                "stage_time" : self.house_stage_time_dict
+            })
+
+        self.house_stage_time_dict = {}
+
+    def get_dict(self):
+        return {
+            "stage_time" : self.stage_time_dict,
+            "count" : self.count_dict,
+            "slow_house_list" : self.slow_house_list
+        }
+
+    def save(self, stats_file_path):
+        with open(stats_file_path, "w") as f:
+            json.dump(self.get_dict(), f, indent=4)
+
+    def print_stats(self):
+        print("Build stage time :")
+        for stage, run_time in sorted(self.stage_time_dict.items(), key=lambda item: - item[1]):
+            print("    %-16s %10.4f s" % (stage, run_time))
+
+        print("Build counts :")
+        for name, num in self.count_dict.items():
+            print("    %-16s %10d" % (name, num))
+
+        if self.slow_house_time is not None:
+            print("Slow houses num :", len(self.slow_house_list), ", at least", self.slow_house_time, "s each")
+
+class BuildCheckpoint:
+    # one json line of settings and colors, then one json line for each finished house
+    def __init__(self, checkpoint_path, settings):
+        self.checkpoint_path = checkpoint_path
+        self.settings = json.loads(json.dumps(settings))
+
+        self.color_list = None
+        self.file = None
+
+        checkpoint_folder_path = os.path.dirname(self.checkpoint_path)
+        if checkpoint_folder_path != "" and not os.path.exists(checkpoint_folder_path):
+            os.makedirs(checkpoint_folder_path)
+
+    def load_record_list(self):
+        if not os.path.exists(self.checkpoint_path):
+            return []
+
+        record_dict = {}
+
+        with open(self.checkpoint_path, "r") as f:
+            line_list = f.readlines()
+
+        for i in range(len(line_list)):
+            try:
+                line = json.loads(line_list[i])
+            except json.JSONDecodeError:
+                # the last line may be cut by a crash
+                break
+
+            if i == 0:
+                if line.get("settings") != self.settings:
+                    print("checkpoint settings changed, rebuild all houses :", self.checkpoint_path)
+                    return []
+
+                self.color_list = line["color_list"]
+                continue
+
+            # a house written again moves to the end
+            record_dict.pop(line["json_id"], None)
+            record_dict[line["json_id"]] = line
+
+        return list(record_dict.values())
+
+    def open(self, color_list, record_list):
+        temp_checkpoint_path = self.checkpoint_path + ".tmp"
+        with open(temp_checkpoint_path, "w") as f:
+            f.write(json.dumps({"settings" : self.settings, "color_list" : color_list}) + "\n")
+            for record in record_list:
+                f.write(json.dumps(record) + "\n")
+        os.replace(temp_checkpoint_path, self.checkpoint_path)
+
+        self.file = open(self.checkpoint_path, "a")
+
+    def add_record(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+class HouseCache:
+    # least recently used houses with their label channels, bounded by their byte size
+    def __init__(self, max_byte_size):
+        self.max_byte_size = max_byte_size
+        self.byte_size = 0
+
+        self.house_dict = OrderedDict()
+
+    def get_house_byte_size(self, house):
+        byte_size = 0
+
+        if house.node_array is not None:
+            byte_size += house.node_array.bbox_array.nbytes + house.node_array.model_index_array.nbytes
+
+        scope_object_list = [house]
+        for level in house.level_list:
+            scope_object_list.append(level)
+            scope_object_list.extend(level.room_list)
+
+        for scope_object in scope_object_list:
+            if scope_object.label_channel is not None:
+                byte_size += scope_object.label_channel.nbytes
+            if scope_object.label_rect_array is not None:
+                byte_size += scope_object.label_rect_array.nbytes
+
+        return byte_size
+
+    def get(self, house_index):
+        house_info = self.house_dict.get(house_index)
+        if house_info is None:
+            return None
+
+        self.house_dict.move_to_end(house_index)
+        return house_info[0]
+
+    def put(self, house_index, house):
+        byte_size = self.get_house_byte_size(house)
+
+        self.house_dict[house_index] = [house, byte_size]
+        self.byte_size += byte_size
+
+        # the newest house always stays, even if it is bigger than the cache
+        while self.byte_size > self.max_byte_size and len(self.house_dict) > 1:
+            _, house_info = self.house_dict.popitem(False)
+            self.byte_size -= house_info[1]
+
+def load_house(json_id, json_file_path, target_width, target_height, size_fixed, cache_path=None, stats=None):
+    house = House(json_id, target_width, target_height, size_fixed)
+
+    if cache_path is not None:
+        json_stat = get_json_stat(json_file_path)
+        cache_file_path = get_cache_file_path(cache_path, json_file_path)
+
+        if stats is not None:
+            start_time = perf_counter()
+
+        is_loaded = house.load_cache(cache_file_path, json_stat)
+
+        if stats is not None:
+            stats.add_time("cache_load", start_time)
+
+        if is_loaded:
+            return house
+
+        house = House(json_id, target_width, target_height, size_fixed)
+
+    if stats is None:
+        house.load_json(json_file_path)
+    else:
+        start_time = perf_counter()
+        json_dict = load_house_json(json_file_path)
+        stats.add_time("json_decode", start_time)
+
+        start_time = perf_counter()
+        house.load_json_dict(json_dict)
+        stats.add_time("hierarchy", start_time)
+
+        stats.add_count("parsed_houses")
+
+    if cache_path is not None:
+        if stats is not None:
+            start_time = perf_counter()
+
+        house.save_cache(cache_file_path, json_stat)
+
+        if stats is not None:
+            stats.add_time("cache_save", start_time)
+
+    return house
+
+def load_resolution_house_list(json_id, json_file_path, target_size_list, size_fixed, cache_path=None, stats=None):
+    # the house.json is parsed once, the other target sizes copy its hierarchy
+    target_width, target_height = target_size_list[0]
+    house = load_house(json_id, json_file_path, target_width, target_height, size_fixed, cache_path, stats)
+
+    house_list = [house]
+    for target_width, target_height in target_size_list[1:]:
+        house_list.append(house.copy(target_width, target_height))
+
+    return house_list
+
+worker_house_args = None
+
+def init_house_worker(target_size_list, size_fixed, cache_path, label_list, use_stats):
+    global worker_house_args
+    # with fork the parent label is inherited as is, so drop its writer and keep channels in label_array
+    for label in label_list:
+        label.label_writer = None
+        label.label_count_writer = None
+        label.shard_writer = None
+        # threads are not forked, the worker processes write their images themselves
+        label.image_writer = None
+        label.label_array = []
+        label.label_store = None
+        if label.label_store_path is not None:
+            label.open_label_store(None)
+    worker_house_args = [target_size_list, size_fixed, cache_path, label_list, use_stats]
+
+def create_house_worker(json_info):
+    json_id, json_file_path, database_index_list = json_info
+    target_size_list, size_fixed, cache_path, label_list, use_stats = worker_house_args
+
+    # the stats of each house go back with it and are added to the parent stats
+    stats = None
+    if use_stats:
+        stats = BuildStats()
+    for label in label_list:
+        label.stats = stats
+
+    house_list = load_resolution_house_list(json_id, json_file_path, [target_size_list[i] for i in database_index_list], size_fixed, cache_path, stats)
+
+    result_list = []
+    for database_index, house in zip(database_index_list, house_list):
+        label = label_list[database_index]
+
+        house.create_label_channel(label)
+
+        label_array = label.label_array
+        label.label_array = []
+
+        label_channel_list = []
+        if label.label_store is not None:
+            label_channel_list = label.label_store.label_channel_list
+            label.label_store.label_channel_list = []
+
+        result_list.append([house, label_array, label_channel_list])
+
+    return result_list, stats
 
 
 class SUNCGDataBase:
@@ -620,7 +2299,24 @@ class SUNCGDataBase:
                 channel_num=1,
                 use_color=False,
                 free_label=True,
-                number_type=np.uint8
+                number_type=np.uint8,
+                num_workers=1,
+                cache_path=None,
+                label_store_path=None,
+                checkpoint_path=None,
+                lazy=False,
+                house_cache_size=1 << 30,
+                target_size_list=None,
+                build_stats=None,
+                image_format="jpg",
+                image_thread_num=0,
+                image_queue_size=64,
+                shard_size=0,
+                label_scope_list=None,
+                sparse_label=False,
+                pack_binary=False,
+                one_hot=False,
+                one_hot_overlap="last"
                 ):
         self.json_id_path = json_id_path
         self.target_width = target_width
@@ -636,9 +2332,42 @@ class SUNCGDataBase:
         self.use_color = use_color
         self.free_label = free_label
         self.number_type = number_type
+        self.num_workers = num_workers
+        self.cache_path = cache_path
+        self.label_store_path = label_store_path
+        self.checkpoint_path = checkpoint_path
+        self.lazy = lazy
+        self.house_cache_size = house_cache_size
+        # [[target_width, target_height], ...] to build every size in one pass, target_width and target_height are not used then
+        self.target_size_list = target_size_list
+        # a BuildStats to measure the build, all the target sizes add to it
+        self.build_stats = build_stats
+        # when save_path is a folder, image_thread_num > 0 writes the images in background threads
+        self.image_format = image_format
+        self.image_thread_num = image_thread_num
+        self.image_queue_size = image_queue_size
+        # when save_path is a folder, shard_size > 0 saves shards of this many label channels instead of images
+        self.shard_size = shard_size
+        # scopes to build, by default the ones that are saved, or all of them when the label channels are kept or stored
+        self.label_scope_list = label_scope_list
+        # keep [label_index, x_min, x_max, y_min, y_max] rows instead of label channels, they are painted when sampled
+        self.sparse_label = sparse_label
+        # keep the binary label channels with one bit per pixel, and save them so in .npy files and shards
+        self.pack_binary = pack_binary
+        # [H, W, len(valid_label_list)] masks, one_hot_overlap is last or any for pixels covered by several labels
+        self.one_hot = one_hot
+        self.one_hot_overlap = one_hot_overlap
 
         self.json_id_list = []
         self.house_list = []
+        self.label_store = None
+        self.checkpoint = None
+        self.house_cache = None
+        self.invalid_house_dict = {}
+        self.sample_index = {}
+        self.sample_row = {}
+        self.sample_rng = np.random.default_rng()
+        self.resolution_database_list = [self]
 
         if self.json_id_path[-1] != "/":
             self.json_id_path += "/"
@@ -646,7 +2375,78 @@ class SUNCGDataBase:
         if self.save_path[-4:] != ".npy":
             if self.save_path[-1] != "/":
                 self.save_path += "/"
+        elif self.shard_size > 0:
+            raise ValueError("shard_size needs save_path to be a folder, got " + self.save_path)
+
+        if self.shard_size > 0 and self.checkpoint_path is not None:
+            raise ValueError("checkpoint_path can not be used with shard_size")
+
+        if self.sparse_label and self.label_store_path is not None:
+            raise ValueError("label_store_path can not be used with sparse_label, the label store keeps painted label channels")
+
+        if self.one_hot:
+            if self.valid_label_list is None or self.is_binary:
+                raise ValueError("one_hot needs valid_label_list and is_binary=False")
+            if self.one_hot_overlap not in ["last", "any"]:
+                raise ValueError("one_hot_overlap must be last or any, got " + str(self.one_hot_overlap))
+            # one channel per valid label
+            self.channel_num = len(self.valid_label_list)
+
+            if self.save_path[-4:] != ".npy" and self.shard_size == 0 and self.image_format != "npy" and len(self.save_object) > 0:
+                raise ValueError("one hot label channels can only be saved as npy, got image_format " + self.image_format)
+
+        if self.pack_binary and not self.is_binary and not self.one_hot:
+            raise ValueError("pack_binary needs is_binary=True or one_hot=True")
+
+        if self.cache_path is not None:
+            if self.cache_path[-1] != "/":
+                self.cache_path += "/"
+            if not os.path.exists(self.cache_path):
+                os.makedirs(self.cache_path)
+
+        if self.target_size_list is not None:
+            self.target_width, self.target_height = self.target_size_list[0]
+
+            for target_width, target_height in self.target_size_list[1:]:
+                self.resolution_database_list.append(self.create_resolution_database(target_width, target_height))
+
+            self.set_resolution_path()
 
+        self.create_label()
+
+        self.load_json()
+
+    def create_resolution_database(self, target_width, target_height):
+        database = copy.copy(self)
+        database.target_width = target_width
+        database.target_height = target_height
+
+        database.json_id_list = []
+        database.house_list = []
+        database.invalid_house_dict = {}
+        database.sample_index = {}
+        database.sample_row = {}
+        database.sample_rng = np.random.default_rng()
+        database.resolution_database_list = [database]
+
+        database.set_resolution_path()
+        database.create_label()
+
+        return database
+
+    def set_resolution_path(self):
+        self.save_path = get_resolution_path(self.save_path, self.target_width, self.target_height)
+        self.label_store_path = get_resolution_path(self.label_store_path, self.target_width, self.target_height)
+        self.checkpoint_path = get_resolution_path(self.checkpoint_path, self.target_width, self.target_height)
+
+    def get_resolution_database(self, target_width, target_height):
+        for database in self.resolution_database_list:
+            if database.target_width == target_width and database.target_height == target_height:
+                return database
+
+        raise ValueError("no database is built for target size " + str(target_width) + "x" + str(target_height))
+
+    def create_label(self):
         self.label = Label(self.label_file_path,
                             self.valid_label_list,
                             self.is_binary,
@@ -656,33 +2456,444 @@ class SUNCGDataBase:
                             self.channel_num,
                             self.use_color,
                             self.free_label,
-                            self.number_type
+                            self.number_type,
+                            self.label_store_path,
+                            self.shard_size,
+                            self.label_scope_list,
+                            self.sparse_label,
+                            self.pack_binary,
+                            self.one_hot,
+                            self.one_hot_overlap
                             )
+        self.label.stats = self.build_stats
+        self.label.image_format = self.image_format
 
-        self.load_json()
+    def add_house(self, json_id, json_file_path, database_index_list=[0]):
+        database_list = [self.resolution_database_list[i] for i in database_index_list]
 
-    def add_house(self, json_id, json_file_path):
-        house = House(json_id, self.target_width, self.target_height, self.size_fixed)
-        house.load_json(json_file_path)
+        output_start_list = []
+        target_size_list = []
+        for database in database_list:
+            output_start_list.append(database.get_output_start())
+            target_size_list.append([database.target_width, database.target_height])
+
+        house_list = load_resolution_house_list(json_id, json_file_path, target_size_list, self.size_fixed, self.cache_path, self.build_stats)
+
+        for database, house, output_start in zip(database_list, house_list, output_start_list):
+            house.create_label_channel(database.label)
+
+            database.house_list.append(house)
+
+            database.finish_house(house, json_file_path, output_start)
+
+        if self.build_stats is not None:
+            self.build_stats.finish_house(json_id)
+
+    def update_label_row(self, house, row_list):
+        if house.label_row is not None:
+            house.label_row = row_list[house.label_row]
+        for level in house.level_list:
+            if level.label_row is not None:
+                level.label_row = row_list[level.label_row]
+            for room in level.room_list:
+                if room.label_row is not None:
+                    room.label_row = row_list[room.label_row]
+
+    def get_label_key_list(self):
+        key_list = []
+
+        for house_index in range(len(self.house_list)):
+            house = self.house_list[house_index]
+            if house.label_row is not None:
+                key_list.append(["House", house_index, -1, -1, house.label_row])
+
+            for level_index in range(len(house.level_list)):
+                level = house.level_list[level_index]
+                if level.label_row is not None:
+                    key_list.append(["Level", house_index, level_index, -1, level.label_row])
+
+                for room_index in range(len(level.room_list)):
+                    room = level.room_list[room_index]
+                    if room.label_row is not None:
+                        key_list.append(["Room", house_index, level_index, room_index, room.label_row])
+
+        return key_list
+
+    def save_label_store(self):
+        self.label.label_store.save_index(self.get_label_key_list())
+        self.label.label_store = None
+
+        self.label_store = LabelStore(self.label_store_path, self.number_type, "r")
+        print("Saved label store at :", self.label_store_path)
+
+    def get_label_channel(self, scope_object, augment_args=None):
+        if self.sparse_label:
+            return self.paint_label_channel(scope_object, augment_args)
+
+        if augment_args is not None:
+            raise ValueError("augmentation needs sparse_label=True")
+
+        if self.label_store is not None and scope_object.label_row is not None:
+            return self.label_store.get_label_channel(scope_object.label_row)
+
+        if self.pack_binary and scope_object.label_channel is not None:
+            return self.label.unpack_label_channel(scope_object.label_channel, scope_object.width)
 
-        house.create_label_channel(self.label)
+        return scope_object.label_channel
+
+    def paint_label_channel(self, scope_object, augment_args=None, out=None):
+        # augment_args are [flip_x, flip_y, rot90, shift_x, shift_y] of augment_rect_array
+        rect_array = scope_object.label_rect_array
+        if rect_array is None:
+            return None
+
+        width = scope_object.width
+        height = scope_object.height
+        if augment_args is not None:
+            rect_array, width, height = augment_rect_array(rect_array, width, height, *augment_args)
+
+        if out is None:
+            out = create_label_channel_array(self.label, width, height)
+        elif out.shape[:2] != (height, width):
+            raise ValueError("out must have height " + str(height) + " and width " + str(width) + ", got shape " + str(out.shape))
+        else:
+            out.fill(0)
+
+        paint_rect_label(out, rect_array, self.label)
+
+        return out
+
+    def copy_label_channel(self, scope_object, out, augment_args=None):
+        if self.sparse_label:
+            if self.paint_label_channel(scope_object, augment_args, out) is None:
+                raise ValueError("label rectangles are not kept, use free_label=False")
+            return
+
+        if self.pack_binary and scope_object.label_channel is not None and (self.label_store is None or scope_object.label_row is None):
+            self.label.unpack_label_channel(scope_object.label_channel, scope_object.width, out)
+            return
+
+        label_channel = self.get_label_channel(scope_object, augment_args)
+        if label_channel is None:
+            raise ValueError("label channels are not kept, use free_label=False or label_store_path")
+        out[...] = label_channel
+
+    def load_json_parallel(self, json_id_list, total_json_id_num):
+        loaded_json_id_num = 0
+
+        label_list = []
+        target_size_list = []
+        for database in self.resolution_database_list:
+            # forked workers inherit the writer buffer, so it must be empty before they start
+            database.label.flush_label_writer()
+            label_list.append(database.label)
+            target_size_list.append([database.target_width, database.target_height])
+
+        with Pool(self.num_workers,
+                    init_house_worker,
+                    (target_size_list, self.size_fixed, self.cache_path, label_list, self.build_stats is not None)
+                    ) as pool:
+            # imap keeps the order of json_id_list, so house_list and label_array match the serial path
+            for result_list, stats in pool.imap(create_house_worker, json_id_list, 4):
+                json_id, json_file_path, database_index_list = json_id_list[loaded_json_id_num]
+
+                if stats is not None:
+                    self.build_stats.add_stats(stats)
+
+                for database_index, result in zip(database_index_list, result_list):
+                    house, label_array, label_channel_list = result
+                    database = self.resolution_database_list[database_index]
+
+                    output_start = database.get_output_start()
+
+                    database.house_list.append(house)
+
+                    for save_args in label_array:
+                        database.label.save_label_channel(*save_args)
+
+                    if database.label.label_store is not None:
+                        row_list = []
+                        for label_channel in label_channel_list:
+                            row_list.append(database.label.store_label_channel(label_channel))
+                        database.update_label_row(house, row_list)
+
+                    database.finish_house(house, json_file_path, output_start)
+
+                if self.build_stats is not None:
+                    self.build_stats.finish_house(json_id)
+
+                loaded_json_id_num += 1
+
+                print("\rLoaded houses num :", loaded_json_id_num, "/", total_json_id_num, "    ", end="")
+
+    def get_build_settings(self):
+        return {
+            "target_width" : self.target_width,
+            "target_height" : self.target_height,
+            "size_fixed" : self.size_fixed,
+            "label_file_path" : self.label_file_path,
+            "valid_label_list" : self.valid_label_list,
+            "is_binary" : self.is_binary,
+            "min_node_num" : self.min_node_num,
+            "save_object" : list(self.save_object),
+            "save_path" : self.save_path,
+            "channel_num" : self.channel_num,
+            "use_color" : self.use_color,
+            "number_type" : np.dtype(self.number_type).str,
+            "label_store_path" : self.label_store_path,
+            "image_format" : self.image_format,
+            "built_scope_list" : self.label.built_scope_list,
+            "pack_binary" : self.pack_binary,
+            "one_hot" : self.one_hot,
+            "one_hot_overlap" : self.one_hot_overlap
+        }
+
+    def get_output_start(self):
+        npy_start = 0
+        if self.label.label_writer is not None:
+            npy_start = self.label.label_writer.row_num
+
+        store_start = 0
+        if self.label.label_store is not None:
+            store_start = len(self.label.label_store.row_list)
+
+        return [npy_start, store_start]
+
+    def finish_house(self, house, json_file_path, output_start):
+        self.label.flush_label_writer()
+
+        if self.checkpoint is not None:
+            # a house is only recorded when its images are on disk
+            self.label.flush_image_writer()
+
+        if self.build_stats is not None:
+            self.build_stats.add_house(house)
+
+        if self.checkpoint is None:
+            return
+
+        npy_start, store_start = output_start
+        npy_end, store_end = self.get_output_start()
+
+        store_row_list = []
+        if self.label.label_store is not None:
+            store_row_list = self.label.label_store.row_list[store_start:store_end]
+
+        valid_list = []
+        for scope, level_index, room_index, scope_object in self.get_scope_object_list(house):
+            if scope_object.is_valid:
+                local_row = -1
+                if scope_object.label_row is not None:
+                    local_row = scope_object.label_row - store_start
+                valid_list.append([scope, level_index, room_index, local_row])
+
+        self.checkpoint.add_record({
+            "json_id" : house.json_id,
+            "json_stat" : get_json_stat(json_file_path),
+            "npy_row" : [npy_start, npy_end],
+            "store_row" : store_row_list,
+            "valid" : valid_list
+        })
+
+    def get_scope_object_list(self, house):
+        scope_object_list = [["House", -1, -1, house]]
+        for level_index in range(len(house.level_list)):
+            level = house.level_list[level_index]
+            scope_object_list.append(["Level", level_index, -1, level])
+            for room_index in range(len(level.room_list)):
+                scope_object_list.append(["Room", level_index, room_index, level.room_list[room_index]])
+
+        return scope_object_list
+
+    def load_checkpoint(self):
+        self.checkpoint = BuildCheckpoint(self.checkpoint_path, self.get_build_settings())
+
+        json_file_path_dict = {}
+        for json_id, json_file_path in self.json_id_list:
+            json_file_path_dict[json_id] = json_file_path
+
+        record_list = []
+        for record in self.checkpoint.load_record_list():
+            json_file_path = json_file_path_dict.get(record["json_id"])
+            if json_file_path is None:
+                continue
+            if record["json_stat"] != get_json_stat(json_file_path):
+                continue
+            record_list.append(record)
+
+        if self.label.save_as_npy and not os.path.exists(self.save_path):
+            record_list = []
+        if self.label.save_as_npy and not os.path.exists(get_label_count_path(self.save_path)):
+            record_list = []
+        if self.label_store_path is not None and not os.path.exists(self.label_store_path + "/label_channel.npy"):
+            record_list = []
+
+        if len(record_list) > 0 and self.checkpoint.color_list is not None:
+            self.label.set_color_list(self.checkpoint.color_list)
+
+        return record_list
+
+    def open_label_output(self, record_list):
+        resume = len(record_list) > 0
+
+        if self.label.save_as_npy:
+            if resume:
+                npy_range_list = []
+                npy_row_num = 0
+                for record in record_list:
+                    start, end = record["npy_row"]
+                    npy_range_list.append([start, end])
+                    record["npy_row"] = [npy_row_num, npy_row_num + end - start]
+                    npy_row_num += end - start
+                keep_npy_range(self.save_path, self.label.get_save_dtype(), npy_range_list)
+                keep_npy_range(get_label_count_path(self.save_path), np.int32, npy_range_list)
+
+            self.label.open_label_writer(resume)
+
+        if self.label_store_path is not None:
+            store_row_list = []
+
+            if resume:
+                store_range_list = []
+                store_offset = 0
+                for record in record_list:
+                    record_store_row_list = record["store_row"]
+                    record["store_row_start"] = len(store_row_list)
+                    if len(record_store_row_list) == 0:
+                        continue
+
+                    offset, height, width, channel_num = record_store_row_list[-1]
+                    start = record_store_row_list[0][0]
+                    end = offset + height * width * channel_num
+                    store_range_list.append([start, end])
+
+                    for row in record_store_row_list:
+                        row[0] += store_offset - start
+                        store_row_list.append(row)
+                    store_offset += end - start
+                keep_npy_range(self.label_store_path + "/label_channel.npy", self.number_type, store_range_list, True)
+
+            self.label.open_label_store(self.label_store_path, resume)
+            self.label.label_store.row_list = store_row_list
+
+    def restore_house(self, record, json_file_path):
+        house = load_house(record["json_id"], json_file_path, self.target_width, self.target_height, self.size_fixed, self.cache_path, self.build_stats)
+
+        if not self.free_label:
+            self.label.save_enabled = False
+            house.create_label_channel(self.label)
+            self.label.save_enabled = True
+
+        scope_object_dict = {}
+        for scope, level_index, room_index, scope_object in self.get_scope_object_list(house):
+            scope_object.is_valid = False
+            scope_object.label_row = None
+            scope_object_dict[(scope, level_index, room_index)] = scope_object
+
+        for scope, level_index, room_index, local_row in record["valid"]:
+            scope_object = scope_object_dict[(scope, level_index, room_index)]
+            scope_object.is_valid = True
+            if local_row >= 0 and self.label.label_store is not None:
+                scope_object.label_row = record["store_row_start"] + local_row
 
         self.house_list.append(house)
 
+        if self.build_stats is not None:
+            self.build_stats.add_count("restored_houses")
+            self.build_stats.finish_house(house.json_id)
+
+    def open_build(self):
+        record_list = []
+        if self.checkpoint_path is not None:
+            record_list = self.load_checkpoint()
+
+        self.open_label_output(record_list)
+
+        if self.shard_size > 0:
+            packed_width = None
+            if self.pack_binary:
+                packed_width = self.target_width
+            self.label.open_shard_writer(packed_width)
+        elif not self.label.save_as_npy and self.image_thread_num > 0 and len(self.save_object) > 0:
+            self.label.open_image_writer(self.image_thread_num, self.image_queue_size)
+
+        if self.checkpoint is not None:
+            self.checkpoint.open(self.label.color_list, record_list)
+
+        return record_list
+
+    def close_build(self):
+        self.label.close_image_writer()
+
+        if self.checkpoint is not None:
+            self.checkpoint.close()
+
+        if self.label.save_as_npy:
+            self.label.close_label_writer()
+            print("Saved as npy file at :", self.save_path)
+
+        if self.label.shard_writer is not None:
+            self.label.close_shard_writer()
+            print("Saved as shards at :", self.save_path)
+
+        if self.label_store_path is not None:
+            self.save_label_store()
+
+        self.create_sample_index()
+
     def load_json(self):
         if self.json_id_path is not None:
             source_json_id_list = os.listdir(self.json_id_path)
 
             total_json_id_num = len(source_json_id_list)
 
-            loaded_json_id_num = 0
-
             for json_id in source_json_id_list:
                 json_file_path = self.json_id_path + json_id + "/house.json"
                 if os.path.exists(json_file_path):
                     self.json_id_list.append([json_id, json_file_path])
 
-                    self.add_house(json_id, json_file_path)
+            for database in self.resolution_database_list[1:]:
+                database.json_id_list = self.json_id_list
+
+            if self.lazy:
+                for database in self.resolution_database_list:
+                    database.init_lazy()
+                return
+
+            json_file_path_dict = {}
+            for json_id, json_file_path in self.json_id_list:
+                json_file_path_dict[json_id] = json_file_path
+
+            restored_json_id_set_list = []
+            for database in self.resolution_database_list:
+                restored_json_id_set = set()
+
+                for record in database.open_build():
+                    database.restore_house(record, json_file_path_dict[record["json_id"]])
+                    restored_json_id_set.add(record["json_id"])
+
+                    print("\rRestored houses num :", len(restored_json_id_set), "/", total_json_id_num, "    ", end="")
+
+                restored_json_id_set_list.append(restored_json_id_set)
+
+            # each house is built once for all the databases that do not have it yet
+            new_json_id_list = []
+            for json_id, json_file_path in self.json_id_list:
+                database_index_list = []
+                for i in range(len(self.resolution_database_list)):
+                    if json_id not in restored_json_id_set_list[i]:
+                        database_index_list.append(i)
+
+                if len(database_index_list) > 0:
+                    new_json_id_list.append([json_id, json_file_path, database_index_list])
+
+            loaded_json_id_num = total_json_id_num - len(new_json_id_list)
+
+            if self.num_workers > 1:
+                self.load_json_parallel(new_json_id_list, total_json_id_num)
+            else:
+                for json_id, json_file_path, database_index_list in new_json_id_list:
+                    self.add_house(json_id, json_file_path, database_index_list)
 
                     loaded_json_id_num += 1
 
@@ -694,93 +2905,456 @@ class SUNCGDataBase:
 
             print()
 
-            if self.label.save_as_npy:
-                np.save(self.save_path, self.label.label_array)
-                print("Saved as npy file at :", self.save_path)
+            for database in self.resolution_database_list:
+                database.close_build()
+
+            if self.build_stats is not None:
+                self.build_stats.print_stats()
+
+    def init_lazy(self):
+        # houses are loaded when a sample needs them, and their label channels are only kept in the cache
+        self.label.save_enabled = False
+        self.label.free_label = False
+        self.label.update_built_scope_list()
+
+        self.house_cache = HouseCache(self.house_cache_size)
+        self.invalid_house_dict = {"House" : set(), "Level" : set(), "Room" : set()}
+
+        print("Found houses num :", len(self.json_id_list), ", they will be loaded when sampled")
+
+    def get_house_num(self):
+        if self.lazy:
+            return len(self.json_id_list)
+
+        return len(self.house_list)
+
+    def get_house(self, house_index):
+        if not self.lazy:
+            return self.house_list[house_index]
+
+        house = self.house_cache.get(house_index)
+
+        if house is None:
+            json_id, json_file_path = self.json_id_list[house_index]
+
+            house = load_house(json_id, json_file_path, self.target_width, self.target_height, self.size_fixed, self.cache_path, self.build_stats)
+            house.create_label_channel(self.label)
+
+            self.house_cache.put(house_index, house)
+
+            if self.build_stats is not None:
+                self.build_stats.add_house(house)
+                self.build_stats.finish_house(json_id)
+
+        return house
 
     def create_label_channel(self):
+        if self.lazy:
+            self.house_cache = HouseCache(self.house_cache_size)
+            return
+
         for house in self.house_list:
             house.create_label_channel(self.label)
 
-    def load_label_channel(self, trans_root, room_id_list=None):
-        if room_id_list is None:
-            while True:
-                house_index, level_index, room_index = [None, None, None]
+        self.create_sample_index()
+
+    def create_sample_index(self):
+        # the weights keep the distribution of the old rejection sampling : a random house, then a random level, then a random room
+        house_index_list = []
+        house_weight_list = []
+        house_row_list = []
+        level_index_list = []
+        level_weight_list = []
+        level_row_list = []
+        room_index_list = []
+        room_weight_list = []
+        room_row_list = []
+
+        for house_index in range(len(self.house_list)):
+            house = self.house_list[house_index]
+            if house.is_valid:
+                house_index_list.append([house_index])
+                house_weight_list.append(1.0)
+                house_row_list.append(self.get_label_row(house))
+
+            level_num = len(house.level_list)
+            for level_index in range(level_num):
+                level = house.level_list[level_index]
+                if level.is_valid:
+                    level_index_list.append([house_index, level_index])
+                    level_weight_list.append(1.0 / level_num)
+                    level_row_list.append(self.get_label_row(level))
+
+                room_num = len(level.room_list)
+                for room_index in range(room_num):
+                    room = level.room_list[room_index]
+                    if room.is_valid:
+                        room_index_list.append([house_index, level_index, room_index])
+                        room_weight_list.append(1.0 / (level_num * room_num))
+                        room_row_list.append(self.get_label_row(room))
+
+        self.sample_index = {
+            "House" : [np.array(house_index_list, np.int64).reshape(-1, 1), np.cumsum(house_weight_list)],
+            "Level" : [np.array(level_index_list, np.int64).reshape(-1, 2), np.cumsum(level_weight_list)],
+            "Room" : [np.array(room_index_list, np.int64).reshape(-1, 3), np.cumsum(room_weight_list)]
+        }
+        self.sample_row = {
+            "House" : np.array(house_row_list, np.int64),
+            "Level" : np.array(level_row_list, np.int64),
+            "Room" : np.array(room_row_list, np.int64)
+        }
+
+    def get_label_row(self, scope_object):
+        if self.label_store is None or scope_object.label_row is None:
+            return -1
+
+        return scope_object.label_row
+
+    def get_sample_index(self, trans_root):
+        if trans_root not in self.sample_index:
+            raise ValueError("trans_root must be one of House, Level and Room, got " + str(trans_root))
+
+        index_array, cum_weight = self.sample_index[trans_root]
+
+        if index_array.shape[0] == 0:
+            raise ValueError("there is no valid " + trans_root + " to sample in this database")
+
+        return index_array, cum_weight
+
+    def sample_lazy_object_index(self, trans_root, random_function):
+        # rejection sampling gives the same distribution as the sample index without loading every house first
+        if trans_root not in self.invalid_house_dict:
+            raise ValueError("trans_root must be one of House, Level and Room, got " + str(trans_root))
+
+        invalid_house_set = self.invalid_house_dict[trans_root]
+        house_num = self.get_house_num()
+
+        while True:
+            if len(invalid_house_set) == house_num:
+                raise ValueError("there is no valid " + trans_root + " to sample in this database")
+
+            house_index = min(int(random_function() * house_num), house_num - 1)
+            if house_index in invalid_house_set:
+                continue
+
+            house = self.get_house(house_index)
+
+            has_valid_object = False
+            for scope, _, _, scope_object in self.get_scope_object_list(house):
+                if scope == trans_root and scope_object.is_valid:
+                    has_valid_object = True
+                    break
+
+            if not has_valid_object:
+                invalid_house_set.add(house_index)
+                continue
 
-                if trans_root == "House":
-                    len_house_list = len(self.house_list)
-                    if len_house_list == 0:
-                        continue
-                    house_index = random.randint(0, len_house_list - 1)
+            if trans_root == "House":
+                return [house_index]
 
-                    if not self.house_list[house_index].is_valid:
-                        continue
+            level_num = len(house.level_list)
+            level_index = min(int(random_function() * level_num), level_num - 1)
+            level = house.level_list[level_index]
 
-                    return self.house_list[house_index].label_channel
+            if trans_root == "Level":
+                if level.is_valid:
+                    return [house_index, level_index]
+                continue
 
-                elif trans_root == "Level":
-                    len_house_list = len(self.house_list)
-                    if len_house_list == 0:
-                        continue
-                    house_index = random.randint(0, len_house_list - 1)
+            room_num = len(level.room_list)
+            if room_num == 0:
+                continue
 
-                    len_level_list = len(self.house_list[house_index].level_list)
-                    if len_level_list == 0:
-                        continue
-                    level_index = random.randint(0, len_level_list - 1)
+            room_index = min(int(random_function() * room_num), room_num - 1)
+            if level.room_list[room_index].is_valid:
+                return [house_index, level_index, room_index]
 
-                    if not self.house_list[house_index].level_list[level_index].is_valid:
-                        continue
+    def sample_object_index(self, trans_root):
+        if self.lazy:
+            return self.sample_lazy_object_index(trans_root, random.random)
 
-                    return self.house_list[house_index].level_list[level_index].label_channel
+        index_array, cum_weight = self.get_sample_index(trans_root)
 
-                elif trans_root == "Room":
-                    len_house_list = len(self.house_list)
-                    if len_house_list == 0:
-                        continue
-                    house_index = random.randint(0, len_house_list - 1)
+        sample_index = int(np.searchsorted(cum_weight, random.random() * cum_weight[-1], "right"))
+        if sample_index >= index_array.shape[0]:
+            sample_index = index_array.shape[0] - 1
 
-                    len_level_list = len(self.house_list[house_index].level_list)
-                    if len_level_list == 0:
-                        continue
-                    level_index = random.randint(0, len_level_list - 1)
+        return index_array[sample_index].tolist()
 
-                    len_room_list = len(self.house_list[house_index].level_list[level_index].room_list)
-                    if len_room_list == 0:
-                        continue
-                    room_index = random.randint(0, len_room_list - 1)
+    def get_batch_shape(self, batch_size):
+        if not self.size_fixed:
+            raise ValueError("batch sampling needs size_fixed=True, label channels have different shapes otherwise")
 
-                    if not self.house_list[house_index].level_list[level_index].room_list[room_index].is_valid:
-                        continue
+        if self.channel_num == 1:
+            return (batch_size, self.target_height, self.target_width)
+        return (batch_size, self.target_height, self.target_width, self.channel_num)
+
+    def sample_batch(self, trans_root, batch_size, seed=None, out=None, augment=False, max_shift=0):
+        # augment flips, rotates by 90 degrees and shifts by up to max_shift pixels each sparse label channel
+        if augment and not self.sparse_label:
+            raise ValueError("augment needs sparse_label=True")
+
+        if not self.lazy:
+            index_array, cum_weight = self.get_sample_index(trans_root)
+
+        batch_shape = self.get_batch_shape(batch_size)
+
+        if out is None:
+            out = np.empty(batch_shape, self.number_type)
+        elif out.shape != batch_shape or out.dtype != np.dtype(self.number_type):
+            raise ValueError("out must have shape " + str(batch_shape) + " and dtype " + str(np.dtype(self.number_type)))
+
+        if seed is None:
+            rng = self.sample_rng
+        else:
+            rng = np.random.default_rng(seed)
+
+        # the label channels of a batch keep their shape, so they only turn by 90 degrees when they are square
+        rot90_step = 2
+        if self.target_width == self.target_height:
+            rot90_step = 1
+
+        # the augmentation is drawn after the samples, so a seed gives the same samples with and without it
+        augment_args_list = [None] * batch_size
+
+        if self.lazy:
+            scope_object_list = []
+            for i in range(batch_size):
+                scope_object_list.append(self.get_object(trans_root, self.sample_lazy_object_index(trans_root, rng.random)))
+
+            if augment:
+                augment_args_list = sample_augment_args_list(rng, batch_size, max_shift, rot90_step)
+
+            for i in range(batch_size):
+                self.copy_label_channel(scope_object_list[i], out[i], augment_args_list[i])
+            return out
+
+        sample_index = np.searchsorted(cum_weight, rng.random(batch_size) * cum_weight[-1], "right")
+        np.minimum(sample_index, index_array.shape[0] - 1, out=sample_index)
+
+        if augment:
+            augment_args_list = sample_augment_args_list(rng, batch_size, max_shift, rot90_step)
+
+        label_data = None
+        if self.label_store is not None:
+            label_data = self.label_store.get_label_channel_array()
+
+        # objects without a stored row, e.g. valid only after the label channels were created again, are copied one by one
+        if label_data is not None and (self.sample_row[trans_root] >= 0).all():
+            np.take(label_data, self.sample_row[trans_root][sample_index], 0, out)
+            return out
+
+        if self.pack_binary and not self.sparse_label:
+            # all the packed label channels of the batch are unpacked at once
+            packed_list = []
+            for i in range(batch_size):
+                packed_label_channel = self.get_object(trans_root, index_array[sample_index[i]]).label_channel
+                if packed_label_channel is None:
+                    raise ValueError("label channels are not kept, use free_label=False or label_store_path")
+                packed_list.append(packed_label_channel)
+
+            self.label.unpack_label_channel(np.stack(packed_list), self.target_width, out)
+            return out
+
+        for i in range(batch_size):
+            self.copy_label_channel(self.get_object(trans_root, index_array[sample_index[i]]), out[i], augment_args_list[i])
+
+        return out
+
+    def get_object(self, trans_root, object_index):
+        house = self.get_house(object_index[0])
+        if trans_root == "House":
+            return house
+
+        level = house.level_list[object_index[1]]
+        if trans_root == "Level":
+            return level
+
+        return level.room_list[object_index[2]]
+
+    def load_label_channel(self, trans_root, room_id_list=None):
+        if room_id_list is None:
+            object_index = self.sample_object_index(trans_root)
 
-                    return self.house_list[house_index].level_list[level_index].room_list[room_index].label_channel
+            return self.get_label_channel(self.get_object(trans_root, object_index))
 
         else:
             house_index, level_index, room_index = room_id_list
 
+            house = self.get_house(house_index)
+
             if trans_root == "House":
-                if not self.house_list[house_index].is_valid:
+                if not house.is_valid:
                     print("this house is not valid. id :", room_id_list)
                     return None
 
-                return self.house_list[house_index].label_channel
+                return self.get_label_channel(house)
 
             elif trans_root == "Level":
-                level_index = random.randint(0, len(self.house_list[house_index].level_list) - 1)
-                if not self.house_list[house_index].level_list[level_index].is_valid:
+                level_index = random.randint(0, len(house.level_list) - 1)
+                if not house.level_list[level_index].is_valid:
                     print("this level is not valid. id :", room_id_list)
                     return None
 
-                return self.house_list[house_index].level_list[level_index].label_channel
+                return self.get_label_channel(house.level_list[level_index])
 
             elif trans_root == "Room":
-                room_index = random.randint(0, len(self.house_list[house_index].level_list[level_index].room_list) - 1)
-                if not self.house_list[house_index].level_list[level_index].room_list[room_index].is_valid:
+                room_index = random.randint(0, len(house.level_list[level_index].room_list) - 1)
+                if not house.level_list[level_index].room_list[room_index].is_valid:
                     print("this room is not valid. id :", room_id_list)
                     return None
 
-                return self.house_list[house_index].level_list[level_index].room_list[room_index].label_channel
+                return self.get_label_channel(house.level_list[level_index].room_list[room_index])
+
+
+def get_prefetch_seed(seed, index):
+    return int(np.random.SeedSequence([seed, index]).generate_state(1)[0])
 
+def prefetch_worker(database, trans_root, buffer_name, buffer_shape, number_type, task_queue, ready_queue, seed, worker_index, augment, max_shift):
+    # the database comes from the parent by fork, only the slot numbers go through the queues
+    random.seed(get_prefetch_seed(seed, worker_index))
+    database.sample_rng = np.random.default_rng([seed, worker_index])
+
+    shared_memory = SharedMemory(buffer_name)
+    buffer_array = np.ndarray(buffer_shape, number_type, shared_memory.buf)
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+
+        slot, batch_index = task
+
+        try:
+            # the batch only depends on its index, not on the worker that draws it
+            database.sample_batch(trans_root, buffer_shape[1], [seed, batch_index], buffer_array[slot], augment, max_shift)
+        except ValueError as e:
+            ready_queue.put([slot, batch_index, str(e)])
+            continue
+        except Exception:
+            # any other error goes back to get_batch too, a dead worker would leave it waiting
+            ready_queue.put([slot, batch_index, traceback.format_exc()])
+            continue
+
+        ready_queue.put([slot, batch_index, None])
+
+    del buffer_array
+    shared_memory.close()
+
+def release_prefetch(worker_list, shared_memory):
+    # also called when a PrefetchLoader is collected or at exit without close, so the shared memory is not leaked
+    for worker in worker_list:
+        worker.terminate()
+    for worker in worker_list:
+        worker.join()
+    del worker_list[:]
+
+    try:
+        shared_memory.close()
+    except BufferError:
+        # batches returned by get_batch are still used, the memory is freed with them
+        pass
+    shared_memory.unlink()
+
+class PrefetchLoader:
+    # worker processes fill the slots of a shared memory ring buffer with batches from database.sample_batch
+    # seconds get_batch waits on the workers before it checks that they are still alive
+    worker_check_time = 1.0
+
+    def __init__(self, database, trans_root, batch_size, prefetch_num=4, num_workers=2, seed=None, augment=False, max_shift=0):
+        self.database = database
+        self.trans_root = trans_root
+        self.batch_size = batch_size
+        self.prefetch_num = prefetch_num
+        self.num_workers = num_workers
+        self.seed = seed
+        # augment and max_shift of database.sample_batch
+        self.augment = augment
+        self.max_shift = max_shift
+
+        if self.seed is None:
+            self.seed = get_prefetch_seed(np.random.SeedSequence().entropy, 0)
+
+        if self.prefetch_num < 1 or self.num_workers < 1:
+            raise ValueError("prefetch_num and num_workers must be at least 1")
+
+        if self.augment and not self.database.sparse_label:
+            raise ValueError("augment needs sparse_label=True")
+
+        if not self.database.lazy:
+            self.database.get_sample_index(self.trans_root)
+
+        self.buffer_shape = (self.prefetch_num,) + self.database.get_batch_shape(self.batch_size)
+        buffer_size = int(np.prod(self.buffer_shape)) * np.dtype(self.database.number_type).itemsize
+
+        self.shared_memory = SharedMemory(create=True, size=max(buffer_size, 1))
+        self.buffer_array = np.ndarray(self.buffer_shape, self.database.number_type, self.shared_memory.buf)
+
+        self.task_queue = Queue()
+        self.ready_queue = Queue()
+
+        self.worker_list = []
+        self.finalizer = weakref.finalize(self, release_prefetch, self.worker_list, self.shared_memory)
+        for worker_index in range(self.num_workers):
+            worker = Process(target=prefetch_worker,
+                                args=(self.database, self.trans_root, self.shared_memory.name, self.buffer_shape, self.database.number_type,
+                                    self.task_queue, self.ready_queue, self.seed, worker_index, self.augment, self.max_shift),
+                                daemon=True)
+            worker.start()
+            self.worker_list.append(worker)
+
+        # batches are asked in order, so the next batch to return is always being drawn
+        self.task_batch_index = 0
+        self.batch_index = 0
+        self.ready_slot_dict = {}
+        self.used_slot = None
+
+        for slot in range(self.prefetch_num):
+            self.put_task(slot)
+
+    def put_task(self, slot):
+        self.task_queue.put([slot, self.task_batch_index])
+        self.task_batch_index += 1
+
+    def get_batch(self):
+        # the returned array is a view of the ring buffer, it is overwritten after the next get_batch
+        if self.used_slot is not None:
+            self.put_task(self.used_slot)
+            self.used_slot = None
+
+        while self.batch_index not in self.ready_slot_dict:
+            try:
+                slot, batch_index, error = self.ready_queue.get(timeout=self.worker_check_time)
+            except queue.Empty:
+                for worker in self.worker_list:
+                    if not worker.is_alive():
+                        raise ValueError("prefetch worker exited with code " + str(worker.exitcode) + " before batch " + str(self.batch_index))
+                continue
+
+            self.ready_slot_dict[batch_index] = [slot, error]
+
+        slot, error = self.ready_slot_dict.pop(self.batch_index)
+        self.batch_index += 1
+
+        if error is not None:
+            # the slot of the failed batch draws the next batch, so the next get_batch goes on with the batch after it
+            self.put_task(slot)
+            raise ValueError("prefetch worker failed at batch " + str(self.batch_index - 1) + " : " + error)
+
+        self.used_slot = slot
+        return self.buffer_array[self.used_slot]
+
+    def close(self):
+        self.buffer_array = None
+        # runs release_prefetch only once
+        self.finalizer()
+        self.shared_memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
 
 class JsonLoader:
     def __init__(self, json_id_list_path=None, csv_path=None, show_bbox=False):
@@ -790,6 +3364,7 @@ class JsonLoader:
         self.json = None
         self.image = None
         self.label_list = None
+        self.model_label_dict = None
         self.label_channel = None
         self.show_bbox = show_bbox
 
@@ -804,6 +3379,11 @@ class JsonLoader:
         self.target_image_width = None
         self.target_image_height = None
 
+        # rows of [x_min, x_max, y_min, y_max] on the image, for the nodes with a label
+        self.node_rect_array = None
+        self.node_dist_from_floor_array = None
+        self.node_label_index_array = None
+
         self.valid_object_num = 0
 
         if json_id_list_path is not None:
@@ -839,9 +3419,15 @@ class JsonLoader:
             if line[3] not in self.label_list:
                 self.label_list.append(line[3])
 
+        self.model_label_dict = create_model_label_dict(self.csv, self.label_list)
+
+    def get_label_channel_type(self):
+        if len(self.label_list) <= np.iinfo(np.uint8).max:
+            return np.uint8
+        return np.uint16
+
     def load_json(self, json_path):
-        with open(json_path, "r") as f:
-            self.json = json.load(f)
+        self.json = load_house_json(json_path)
 
         self.image = None
         self.label_channel = None
@@ -889,11 +3475,11 @@ class JsonLoader:
 
         self.trans = [- int(x_min * self.scale), - int(y_min * self.scale), - int(z_min * self.scale)]
 
-    def find_bbox(self, max_dist_from_floor=-1):
-        if self.show_bbox:
-            self.image = np.zeros((self.target_image_height, self.target_image_width, 3))
+        self.load_node_array()
 
-        self.label_channel = np.zeros((self.target_image_height, self.target_image_width))
+    def load_node_array(self):
+        bbox_list = []
+        label_index_list = []
 
         if "levels" in self.json:
             for level in self.json["levels"]:
@@ -905,63 +3491,64 @@ class JsonLoader:
                                 if "modelId" not in node:
                                     continue
 
-                                bbox = node["bbox"]
-
-                                z_min_from_floor = int(bbox["min"][self.z_index] * self.scale) + self.trans[2]
+                                current_label_index = self.model_label_dict.get(node["modelId"])
 
-                                if z_min_from_floor > max_dist_from_floor and max_dist_from_floor != -1:
+                                if current_label_index is None:
                                     continue
 
-                                x_min_on_image = int(bbox["min"][self.x_index] * self.scale) + self.trans[0]
-                                x_max_on_image = int(bbox["max"][self.x_index] * self.scale) + self.trans[0]
+                                bbox = node["bbox"]
 
-                                y_min_on_image = int(bbox["min"][self.y_index] * self.scale) + self.trans[1]
-                                y_max_on_image = int(bbox["max"][self.y_index] * self.scale) + self.trans[1]
+                                bbox_list.append([bbox["min"][self.x_index], bbox["max"][self.x_index], bbox["min"][self.y_index], bbox["max"][self.y_index], bbox["min"][self.z_index]])
+                                label_index_list.append(current_label_index)
 
-                                modelId = node["modelId"]
+        bbox_array = np.array(bbox_list, np.float64).reshape(-1, 5)
 
-                                model_class = ""
+        self.node_rect_array = transform_bbox_array(bbox_array[:, :4], self.scale, self.scale, self.trans)
+        self.node_dist_from_floor_array = (bbox_array[:, 4] * self.scale).astype(np.int64) + self.trans[2]
+        self.node_label_index_array = np.array(label_index_list, np.int64)
 
-                                for line in self.csv:
-                                    if line[1] == modelId:
-                                        model_class = line[3]
-                                        break
+    def get_max_dist_from_floor(self):
+        # the first of 1, 3, 5, ... that keeps at least half of the objects, -1 keeps all of them
+        valid_dist_array = np.sort(self.node_dist_from_floor_array[self.node_label_index_array > 0])
 
-                                if model_class == "":
-                                    continue
+        if valid_dist_array.shape[0] == 0:
+            return -1
 
-                                current_label_index = 0
+        half_dist = int(valid_dist_array[(valid_dist_array.shape[0] + 1) // 2 - 1])
 
-                                for i in range(len(self.label_list)):
-                                    if model_class == self.label_list[i]:
-                                        current_label_index = i + 1
-                                        break
+        if half_dist <= 1:
+            return 1
 
-                                if current_label_index > 0:
-                                    self.valid_object_num += 1
-                                    cv2.rectangle(self.label_channel, (x_min_on_image, y_min_on_image), (x_max_on_image, y_max_on_image), current_label_index, -1)
+        if half_dist % 2 == 0:
+            return half_dist + 1
+        return half_dist
 
-                                if self.show_bbox:
-                                    cv2.rectangle(self.image, (x_min_on_image, y_min_on_image), (x_max_on_image, y_max_on_image), (current_label_index / len(self.label_list), current_label_index / len(self.label_list), current_label_index / len(self.label_list)), -1)
+    def find_bbox(self, max_dist_from_floor=-1):
+        if self.show_bbox:
+            self.image = np.zeros((self.target_image_height, self.target_image_width, 3))
 
-    def create_label_channel(self, index=-1):
-        if index < 0 or index >= len(self.json_id_list):
-            index = random.randint(0, len(self.json_id_list) - 1)
+        self.label_channel = np.zeros((self.target_image_height, self.target_image_width), self.get_label_channel_type())
 
-        self.load_json(self.json_id_list[index])
+        node_mask = np.ones(self.node_label_index_array.shape[0], bool)
+        if max_dist_from_floor != -1:
+            node_mask = self.node_dist_from_floor_array <= max_dist_from_floor
 
-        current_max_dist_to_floor = 1
+        valid_mask = node_mask & (self.node_label_index_array > 0)
+        self.valid_object_num = int(np.count_nonzero(valid_mask))
 
-        self.find_bbox()
+        paint_rectangles(self.label_channel, self.node_rect_array[valid_mask], self.node_label_index_array[valid_mask])
 
-        all_object_num = self.valid_object_num
+        if self.show_bbox:
+            color_array = np.repeat(self.node_label_index_array[node_mask, None] / len(self.label_list), 3, 1)
+            paint_rectangles(self.image, self.node_rect_array[node_mask], color_array)
 
-        self.valid_object_num = 0
+    def create_label_channel(self, index=-1):
+        if index < 0 or index >= len(self.json_id_list):
+            index = random.randint(0, len(self.json_id_list) - 1)
 
-        while self.valid_object_num / all_object_num < 0.5:
-            self.find_bbox(current_max_dist_to_floor)
+        self.load_json(self.json_id_list[index])
 
-            current_max_dist_to_floor += 2
+        self.find_bbox(self.get_max_dist_from_floor())
 
         if self.show_bbox:
             cv2.imshow("bbox", self.image)
@@ -988,6 +3575,23 @@ if __name__ == "__main__":
     use_color = False
     free_label = True
     number_type = np.uint8
+    num_workers = 1
+    cache_path = None
+    label_store_path = None
+    checkpoint_path = None
+    lazy = False
+    house_cache_size = 1 << 30
+    target_size_list = None
+    build_stats = None
+    image_format = "jpg"
+    image_thread_num = 0
+    image_queue_size = 64
+    shard_size = 0
+    label_scope_list = None
+    sparse_label = False
+    pack_binary = False
+    one_hot = False
+    one_hot_overlap = "last"
 
     #### method : load from .json files and compute label channel each time
     #### fps:30
@@ -1017,7 +3621,24 @@ if __name__ == "__main__":
                             channel_num,
                             use_color,
                             free_label,
-                            number_type
+                            number_type,
+                            num_workers,
+                            cache_path,
+                            label_store_path,
+                            checkpoint_path,
+                            lazy,
+                            house_cache_size,
+                            target_size_list,
+                            build_stats,
+                            image_format,
+                            image_thread_num,
+                            image_queue_size,
+                            shard_size,
+                            label_scope_list,
+                            sparse_label,
+                            pack_binary,
+                            one_hot,
+                            one_hot_overlap
                         )
 
     exit()
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark
+
+
+@pytest.fixture(scope="session")
+def dataset_path(tmp_path_factory):
+    # small synthetic SUNCG dataset of benchmark.py, the same files every run
+    dataset_path = str(tmp_path_factory.mktemp("dataset")) + "/"
+    benchmark.create_dataset(dataset_path, 12, 2, 5, 8, 60, 0)
+    return dataset_path
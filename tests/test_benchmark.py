@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+import benchmark
+
+
+def test_rasterize_label_builds_every_scope(dataset_path, tmp_path):
+    bench = benchmark.Benchmark(dataset_path, str(tmp_path) + "/", 16, 16, 1, 4)
+    label = bench.create_label()
+
+    assert label.built_scope_list == ["House", "Level", "Room"]
+
+    house_list = bench.load_house_list()
+    for house in house_list:
+        house.create_label_channel(label)
+
+    # label channels are freed, but the scopes are still painted and found valid
+    room_num = 0
+    for house in house_list:
+        assert house.is_valid
+        for level in house.level_list:
+            assert level.is_valid
+            room_num += sum(room.is_valid for room in level.room_list)
+    assert room_num > len(house_list)
+
+
+def test_create_dataset_keeps_other_datasets(tmp_path):
+    dataset_path = str(tmp_path) + "/"
+    (tmp_path / "house" / "real_house").mkdir(parents=True)
+    (tmp_path / "house" / "real_house" / "house.json").write_text("{}")
+
+    with pytest.raises(ValueError):
+        benchmark.create_dataset(dataset_path, 2, 1, 2, 2, 10)
+    assert os.listdir(dataset_path + "house/") == ["real_house"]
+    assert not os.path.exists(dataset_path + "ModelCategoryMapping.csv")
+
+
+def test_create_dataset_replaces_its_own_dataset(tmp_path):
+    dataset_path = str(tmp_path / "dataset") + "/"
+
+    benchmark.create_dataset(dataset_path, 3, 1, 2, 2, 10)
+    benchmark.create_dataset(dataset_path, 2, 1, 2, 2, 10, 1)
+
+    assert len(os.listdir(dataset_path + "house/")) == 2
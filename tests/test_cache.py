@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+import suncg_loader
+
+
+def get_house_struct(house):
+    level_list = []
+    for level in house.level_list:
+        room_list = []
+        for room in level.room_list:
+            room_list.append([room.x_min, room.x_max, room.y_min, room.y_max, room.node_start, room.node_end])
+        level_list.append([level.x_min, level.x_max, level.y_min, level.y_max, room_list])
+
+    node_bbox = house.node_array.bbox_array.tolist()
+    node_label = [house.node_array.model_id_list[i] for i in house.node_array.model_index_array]
+    return [level_list, node_bbox, node_label]
+
+
+@pytest.mark.parametrize("cache_size", [0, 10, -10])
+def test_broken_cache_is_parsed_again(dataset_path, tmp_path, cache_size):
+    # an empty file, the first bytes of the cache, and the cache without its last bytes
+    json_id = sorted(os.listdir(dataset_path + "house/"))[0]
+    json_file_path = dataset_path + "house/" + json_id + "/house.json"
+    cache_path = str(tmp_path / "cache") + "/"
+    os.makedirs(cache_path)
+
+    house = suncg_loader.load_house(json_id, json_file_path, 16, 16, True)
+    house.create_node_array()
+
+    suncg_loader.load_house(json_id, json_file_path, 16, 16, True, cache_path)
+    cache_file_path = suncg_loader.get_cache_file_path(cache_path, json_file_path)
+    with open(cache_file_path, "rb") as f:
+        cache_bytes = f.read()
+    with open(cache_file_path, "wb") as f:
+        f.write(cache_bytes[:cache_size])
+
+    cached_house = suncg_loader.load_house(json_id, json_file_path, 16, 16, True, cache_path)
+    cached_house.create_node_array()
+    assert get_house_struct(cached_house) == get_house_struct(house)
+
+    # the cache is written again
+    with open(cache_file_path, "rb") as f:
+        assert f.read() == cache_bytes
@@ -0,0 +1,180 @@
+import os
+import random
+
+import cv2
+import numpy as np
+import pytest
+
+import benchmark
+import suncg_loader
+
+SAVE_OBJECT = ["House", "Level", "Room"]
+
+
+def create_database(dataset_path, width, height, save_path, min_node_num=2, is_binary=False, channel_num=1, use_color=False, free_label=False, **kwargs):
+    return suncg_loader.SUNCGDataBase(dataset_path + "house/", width, height, True, dataset_path + "ModelCategoryMapping.csv",
+                                        benchmark.LABEL_LIST, is_binary, min_node_num, SAVE_OBJECT, save_path, channel_num, use_color, free_label, np.uint8, **kwargs)
+
+
+def load_json_sequential(house, json_dict):
+    # the first House.load_json, every room and node is added one by one to the first level or room that contains it
+    house.x_index, house.y_index, house.z_index = 0, 1, 2
+    house.x_min, house.x_max, house.y_min, house.y_max, house.z_min, house.z_max = house.load_bbox(json_dict)
+
+    for level in json_dict["levels"]:
+        house.add_level(suncg_loader.Level(*house.load_bbox(level), house.target_width, house.target_height, house.size_fixed))
+
+        for node in level["nodes"]:
+            if node["type"] == "Room":
+                house.add_room(suncg_loader.Room(*house.load_bbox(node), house.target_width, house.target_height, house.size_fixed))
+
+        for node in level["nodes"]:
+            if node["type"] != "Room":
+                house.add_node(suncg_loader.Node(*house.load_bbox(node), node["modelId"]))
+
+
+def get_hierarchy(house):
+    level_list = []
+    for level in house.level_list:
+        room_list = []
+        for room in level.room_list:
+            node_list = [[node.id, node.x_min, node.x_max, node.y_min, node.y_max, node.z_min, node.z_max, node.label] for node in room.node_list]
+            room_list.append([room.id, room.x_min, room.x_max, room.y_min, room.y_max, room.z_min, room.z_max, room.is_empty, node_list])
+        level_list.append([level.id, level.is_empty, room_list])
+
+    return [house.is_empty, level_list]
+
+
+def create_random_house(rnd, level_num, node_num):
+    def create_bbox(size):
+        x_min = rnd.randint(0, 20)
+        y_min = rnd.randint(0, 20)
+        z_min = rnd.randint(0, 6)
+        return {"min" : [x_min, y_min, z_min], "max" : [x_min + rnd.randint(0, size), y_min + rnd.randint(0, size), z_min + rnd.randint(0, 6)]}
+
+    level_list = []
+    for i in range(level_num):
+        node_list = []
+        for j in range(rnd.randint(0, node_num)):
+            if rnd.random() < 0.4:
+                node_list.append({"valid" : 1, "type" : "Room", "bbox" : create_bbox(15)})
+            else:
+                node_list.append({"valid" : 1, "type" : "Object", "modelId" : "m" + str(rnd.randint(0, 30)), "bbox" : create_bbox(8)})
+
+        level_bbox = {"min" : [rnd.uniform(-2, 5), rnd.uniform(-2, 5), rnd.choice([0, 2])], "max" : [rnd.uniform(15, 40), rnd.uniform(15, 40), rnd.choice([6, 12])]}
+        level_list.append({"bbox" : level_bbox, "nodes" : node_list})
+
+    return {"up" : [0, 0, 1], "bbox" : {"min" : [0, 0, 0], "max" : [40, 40, 12]}, "levels" : level_list}
+
+
+@pytest.mark.parametrize("level_num,node_num", [[1, 10], [4, 60], [24, 8]])
+def test_hierarchy_matches_sequential_loader(level_num, node_num):
+    # more than ContainerIndex.grid_container_num rooms or levels use the grid, the others the contain matrix
+    rnd = random.Random(level_num)
+
+    for i in range(100):
+        json_dict = create_random_house(rnd, rnd.randint(1, level_num), node_num)
+
+        house = suncg_loader.House("h", 32, 32, True)
+        house.load_json_dict(json_dict)
+
+        sequential_house = suncg_loader.House("h", 32, 32, True)
+        load_json_sequential(sequential_house, json_dict)
+
+        assert get_hierarchy(house) == get_hierarchy(sequential_house)
+
+
+def paint_reference(scope_object, label):
+    # the per-node loop of the first create_label_channel, one cv2.rectangle per node
+    if label.channel_num == 1:
+        label_channel = np.zeros((scope_object.height, scope_object.width), label.number_type)
+    else:
+        label_channel = np.zeros((scope_object.height, scope_object.width, label.channel_num), label.number_type)
+
+    valid_node_num = 0
+    for i in range(scope_object.node_start, scope_object.node_end):
+        node = scope_object.node_array.get_node(i)
+        node.update_trans(scope_object.scale_x, scope_object.scale_y, scope_object.trans)
+
+        label_index = label.get_label_index(node.label)
+        if label_index is not None:
+            cv2.rectangle(label_channel, (node.trans_x_min, node.trans_y_min), (node.trans_x_max, node.trans_y_max), label.color_list[label_index], -1)
+            valid_node_num += 1
+
+    return label_channel, valid_node_num >= label.min_node_num
+
+
+@pytest.mark.parametrize("is_binary,channel_num,use_color", [[False, 1, False], [True, 1, False], [True, 3, True], [False, 3, True]])
+def test_rasterization_matches_reference(dataset_path, tmp_path, is_binary, channel_num, use_color):
+    database = create_database(dataset_path, 40, 24, str(tmp_path / "label.npy"), 2, is_binary, channel_num, use_color)
+
+    valid_num = 0
+    for house in database.house_list:
+        for scope, level_index, room_index, scope_object in database.get_scope_object_list(house):
+            if scope_object.is_empty:
+                continue
+
+            label_channel, is_valid = paint_reference(scope_object, database.label)
+            assert scope_object.is_valid == is_valid
+            if is_valid:
+                assert np.array_equal(database.get_label_channel(scope_object), label_channel)
+                valid_num += 1
+
+    assert valid_num > 0
+
+
+def read_bytes(file_path):
+    with open(file_path, "rb") as f:
+        return f.read()
+
+
+def test_checkpoint_resume_matches_fresh_build(dataset_path, tmp_path, monkeypatch):
+    out_path = str(tmp_path) + "/"
+    add_house = suncg_loader.SUNCGDataBase.add_house
+    added_house_num = [0]
+
+    def add_house_interrupted(self, *args):
+        added_house_num[0] += 1
+        if added_house_num[0] > 5:
+            raise KeyboardInterrupt
+        return add_house(self, *args)
+
+    monkeypatch.setattr(suncg_loader.SUNCGDataBase, "add_house", add_house_interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        create_database(dataset_path, 40, 24, out_path + "resume.npy", free_label=True, label_store_path=out_path + "resume_store/", checkpoint_path=out_path + "resume.jsonl")
+    monkeypatch.setattr(suncg_loader.SUNCGDataBase, "add_house", add_house)
+
+    # a record cut short by the interruption is ignored
+    with open(out_path + "resume.jsonl", "a") as f:
+        f.write('{"json_id": "h')
+
+    create_database(dataset_path, 40, 24, out_path + "resume.npy", free_label=True, label_store_path=out_path + "resume_store/", checkpoint_path=out_path + "resume.jsonl")
+    create_database(dataset_path, 40, 24, out_path + "fresh.npy", free_label=True, label_store_path=out_path + "fresh_store/")
+
+    for file_name in ["resume.npy", "resume_label_count.npy", "resume_store/label_channel.npy", "resume_store/label_index.npy"]:
+        fresh_file_name = file_name.replace("resume", "fresh")
+        assert read_bytes(out_path + file_name) == read_bytes(out_path + fresh_file_name), file_name
+
+
+def test_target_size_list_matches_separate_builds(dataset_path, tmp_path):
+    out_path = str(tmp_path) + "/"
+    target_size_list = [[32, 32], [40, 24], [16, 16]]
+
+    database = create_database(dataset_path, 0, 0, out_path + "multi.npy", label_store_path=out_path + "multi_store/", target_size_list=target_size_list)
+
+    for width, height in target_size_list:
+        create_database(dataset_path, width, height, suncg_loader.get_resolution_path(out_path + "single.npy", width, height),
+                        label_store_path=suncg_loader.get_resolution_path(out_path + "single_store/", width, height))
+
+        resolution_database = database.get_resolution_database(width, height)
+        assert [resolution_database.target_width, resolution_database.target_height] == [width, height]
+
+        multi_path = suncg_loader.get_resolution_path(out_path + "multi.npy", width, height)
+        single_path = suncg_loader.get_resolution_path(out_path + "single.npy", width, height)
+        assert read_bytes(multi_path) == read_bytes(single_path)
+        assert read_bytes(suncg_loader.get_label_count_path(multi_path)) == read_bytes(suncg_loader.get_label_count_path(single_path))
+
+        multi_store_path = suncg_loader.get_resolution_path(out_path + "multi_store/", width, height)
+        single_store_path = suncg_loader.get_resolution_path(out_path + "single_store/", width, height)
+        for file_name in os.listdir(multi_store_path):
+            assert read_bytes(multi_store_path + file_name) == read_bytes(single_store_path + file_name), file_name
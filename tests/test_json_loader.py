@@ -0,0 +1,104 @@
+import csv
+import json
+
+import cv2
+import numpy as np
+
+import suncg_loader
+
+
+def write_csv(csv_path, row_list):
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["index", "model_id", "fine_grained_class", "coarse_grained_class"])
+        for row in row_list:
+            writer.writerow(row)
+
+
+def find_bbox_reference(json_loader, max_dist_from_floor=-1):
+    # the node loop of the first JsonLoader.find_bbox, one csv scan and one cv2.rectangle per node
+    label_channel = np.zeros((json_loader.target_image_height, json_loader.target_image_width), json_loader.get_label_channel_type())
+    valid_object_num = 0
+
+    for level in json_loader.json["levels"]:
+        for node in level.get("nodes", []):
+            if "valid" not in node or "type" not in node or node["valid"] != 1 or node["type"] == "Room" or "modelId" not in node:
+                continue
+
+            bbox = node["bbox"]
+
+            z_min_from_floor = int(bbox["min"][json_loader.z_index] * json_loader.scale) + json_loader.trans[2]
+            if z_min_from_floor > max_dist_from_floor and max_dist_from_floor != -1:
+                continue
+
+            x_min = int(bbox["min"][json_loader.x_index] * json_loader.scale) + json_loader.trans[0]
+            x_max = int(bbox["max"][json_loader.x_index] * json_loader.scale) + json_loader.trans[0]
+            y_min = int(bbox["min"][json_loader.y_index] * json_loader.scale) + json_loader.trans[1]
+            y_max = int(bbox["max"][json_loader.y_index] * json_loader.scale) + json_loader.trans[1]
+
+            model_class = ""
+            for line in json_loader.csv:
+                if line[1] == node["modelId"]:
+                    model_class = line[3]
+                    break
+
+            if model_class == "":
+                continue
+
+            label_index = json_loader.label_list.index(model_class) + 1
+            valid_object_num += 1
+            cv2.rectangle(label_channel, (x_min, y_min), (x_max, y_max), label_index, -1)
+
+    return label_channel, valid_object_num
+
+
+def test_empty_class_is_not_painted(tmp_path):
+    csv_path = str(tmp_path / "map.csv")
+    write_csv(csv_path, [["0", "m1", "f1", "chair"], ["1", "m2", "f2", ""]])
+
+    node_list = []
+    for model_id, x_min in [["m1", 0.0], ["m2", 2.0]]:
+        node_list.append({"type" : "Object", "valid" : 1, "modelId" : model_id, "bbox" : {"min" : [x_min, 0.0, 0.0], "max" : [x_min + 1.0, 1.0, 1.0]}})
+    house_dict = {"up" : [0, 0, 1], "bbox" : {"min" : [0.0, 0.0, 0.0], "max" : [4.0, 2.0, 1.0]}, "levels" : [{"nodes" : node_list}]}
+
+    (tmp_path / "house" / "h0").mkdir(parents=True)
+    with open(str(tmp_path / "house" / "h0" / "house.json"), "w") as f:
+        json.dump(house_dict, f)
+
+    json_loader = suncg_loader.JsonLoader(str(tmp_path / "house"), csv_path)
+    json_loader.load_json(json_loader.json_id_list[0])
+    json_loader.find_bbox()
+
+    # label_list is [coarse_grained_class, chair, ""], so m1 is 2 and m2 would be 3
+    assert set(np.unique(json_loader.label_channel).tolist()) == {0, 2}
+    assert json_loader.valid_object_num == 1
+
+
+def test_find_bbox_matches_reference(dataset_path, tmp_path):
+    # every third model has no coarse_grained_class and one model id is listed twice, the first row counts
+    row_list = []
+    with open(dataset_path + "ModelCategoryMapping.csv", "r") as f:
+        reader = csv.reader(f)
+        next(reader)
+        for row in reader:
+            if int(row[1]) % 3 == 0:
+                row[3] = ""
+            row_list.append(row[:4])
+    row_list.append(["-1", "1", "f", "bed"])
+    row_list.append(["-2", "0", "f", "bed"])
+
+    csv_path = str(tmp_path / "map.csv")
+    write_csv(csv_path, row_list)
+
+    json_loader = suncg_loader.JsonLoader(dataset_path + "house", csv_path)
+    json_loader.json_id_list.sort()
+
+    for json_file_path in json_loader.json_id_list:
+        json_loader.load_json(json_file_path)
+
+        for max_dist_from_floor in [-1, 1, 3, 5, 9]:
+            json_loader.find_bbox(max_dist_from_floor)
+            label_channel, valid_object_num = find_bbox_reference(json_loader, max_dist_from_floor)
+
+            assert np.array_equal(json_loader.label_channel, label_channel)
+            assert json_loader.valid_object_num == valid_object_num
@@ -0,0 +1,32 @@
+import numpy as np
+
+import benchmark
+import suncg_loader
+
+
+def create_database(dataset_path, save_path, min_node_num, free_label, **kwargs):
+    return suncg_loader.SUNCGDataBase(dataset_path + "house/", 16, 16, True, dataset_path + "ModelCategoryMapping.csv",
+                                        benchmark.LABEL_LIST, False, min_node_num, [], save_path, 1, False, free_label, np.uint8, **kwargs)
+
+
+def test_store_is_sampled_after_label_channels_are_created_again(dataset_path, tmp_path):
+    database = create_database(dataset_path, str(tmp_path / "out") + "/", 2, True, label_store_path=str(tmp_path / "store") + "/")
+    batch = database.sample_batch("Room", 6, seed=3)
+
+    database.create_label_channel()
+
+    assert (database.sample_row["Room"] >= 0).all()
+    assert np.array_equal(database.sample_batch("Room", 6, seed=3), batch)
+    assert database.load_label_channel("Room") is not None
+
+
+def test_objects_without_stored_row_are_copied(dataset_path, tmp_path):
+    # rooms that only become valid with the lower min_node_num have no row in the label store
+    database = create_database(dataset_path, str(tmp_path / "out") + "/", 3, False, label_store_path=str(tmp_path / "store") + "/")
+    database.label.min_node_num = 1
+    database.create_label_channel()
+    assert (database.sample_row["Room"] < 0).any()
+
+    reference_database = create_database(dataset_path, str(tmp_path / "out") + "/", 1, False)
+    for seed in range(5):
+        assert np.array_equal(database.sample_batch("Room", 16, seed=seed), reference_database.sample_batch("Room", 16, seed=seed))
@@ -0,0 +1,106 @@
+import faulthandler
+import gc
+import os
+import shutil
+import signal
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pytest
+
+import benchmark
+import suncg_loader
+
+
+def create_database(dataset_path, save_path, **kwargs):
+    return suncg_loader.SUNCGDataBase(dataset_path + "house/", 16, 16, True, dataset_path + "ModelCategoryMapping.csv",
+                                        benchmark.LABEL_LIST, False, 1, [], save_path, 1, False, False, np.uint8, **kwargs)
+
+
+def is_unlinked(shared_memory_name):
+    try:
+        shared_memory = SharedMemory(shared_memory_name)
+    except FileNotFoundError:
+        return True
+    shared_memory.close()
+    return False
+
+
+def test_batches_match_sample_batch(dataset_path, tmp_path):
+    database = create_database(dataset_path, str(tmp_path / "out") + "/")
+
+    with suncg_loader.PrefetchLoader(database, "Room", 8, 3, 2, seed=5) as prefetch_loader:
+        batch_list = [prefetch_loader.get_batch().copy() for _ in range(6)]
+        shared_memory_name = prefetch_loader.shared_memory.name
+
+    assert is_unlinked(shared_memory_name)
+    for batch_index in range(6):
+        assert np.array_equal(batch_list[batch_index], database.sample_batch("Room", 8, [5, batch_index]))
+
+
+def test_worker_error_is_raised(dataset_path, tmp_path):
+    # a lazy database whose houses are gone makes the workers fail with FileNotFoundError
+    copy_path = str(tmp_path / "dataset") + "/"
+    shutil.copytree(dataset_path, copy_path)
+    database = create_database(copy_path, str(tmp_path / "out") + "/", lazy=True)
+    shutil.rmtree(copy_path + "house/")
+
+    with suncg_loader.PrefetchLoader(database, "Room", 4, 2, 2, seed=0) as prefetch_loader:
+        with pytest.raises(ValueError, match="FileNotFoundError"):
+            prefetch_loader.get_batch()
+
+
+def test_batches_after_worker_error(dataset_path, tmp_path):
+    # with one house gone only the batches that sample it fail, get_batch goes on with the next batches
+    copy_path = str(tmp_path / "dataset") + "/"
+    shutil.copytree(dataset_path, copy_path)
+    database = create_database(copy_path, str(tmp_path / "out") + "/", lazy=True)
+    os.remove(database.json_id_list[0][1])
+
+    expected_list = []
+    for batch_index in range(16):
+        try:
+            expected_list.append(database.sample_batch("Room", 1, [0, batch_index]))
+        except FileNotFoundError:
+            expected_list.append(None)
+    assert any(expected is None for expected in expected_list[:-1])
+
+    # a get_batch that waits forever fails the test instead of hanging it
+    faulthandler.dump_traceback_later(60, exit=True)
+    try:
+        with suncg_loader.PrefetchLoader(database, "Room", 1, 4, 2, seed=0) as prefetch_loader:
+            for expected in expected_list:
+                if expected is None:
+                    with pytest.raises(ValueError, match="FileNotFoundError"):
+                        prefetch_loader.get_batch()
+                else:
+                    assert np.array_equal(prefetch_loader.get_batch(), expected)
+    finally:
+        faulthandler.cancel_dump_traceback_later()
+
+
+def test_dead_worker_is_raised(dataset_path, tmp_path):
+    database = create_database(dataset_path, str(tmp_path / "out") + "/")
+
+    with suncg_loader.PrefetchLoader(database, "Room", 4, 1, 1, seed=0) as prefetch_loader:
+        prefetch_loader.get_batch()
+
+        os.kill(prefetch_loader.worker_list[0].pid, signal.SIGKILL)
+        prefetch_loader.worker_list[0].join()
+
+        with pytest.raises(ValueError, match="exited"):
+            prefetch_loader.get_batch()
+            prefetch_loader.get_batch()
+
+
+def test_shared_memory_is_unlinked_without_close(dataset_path, tmp_path):
+    database = create_database(dataset_path, str(tmp_path / "out") + "/")
+
+    prefetch_loader = suncg_loader.PrefetchLoader(database, "Room", 4, 2, 1, seed=0)
+    prefetch_loader.get_batch()
+    shared_memory_name = prefetch_loader.shared_memory.name
+
+    del prefetch_loader
+    gc.collect()
+
+    assert is_unlinked(shared_memory_name)
@@ -0,0 +1,46 @@
+import numpy as np
+
+import benchmark
+import suncg_loader
+
+SAVE_OBJECT = ["House", "Level", "Room"]
+
+
+def create_database(dataset_path, valid_label_list, min_node_num, save_path, **kwargs):
+    return suncg_loader.SUNCGDataBase(dataset_path + "house/", 16, 16, True, dataset_path + "ModelCategoryMapping.csv",
+                                        valid_label_list, False, min_node_num, SAVE_OBJECT, save_path, 1, False, True, np.uint8, **kwargs)
+
+
+def test_label_count_matches_workers(dataset_path, tmp_path):
+    create_database(dataset_path, None, 1, str(tmp_path / "serial.npy"))
+    create_database(dataset_path, None, 1, str(tmp_path / "worker.npy"), num_workers=2)
+
+    label_count = np.load(suncg_loader.get_label_count_path(str(tmp_path / "serial.npy")))
+    assert label_count.shape[0] == np.load(str(tmp_path / "serial.npy")).shape[0]
+    assert np.array_equal(label_count, np.load(suncg_loader.get_label_count_path(str(tmp_path / "worker.npy"))))
+
+
+def test_remap_npy_drops_rows_like_a_build(dataset_path, tmp_path):
+    # the full vocabulary is built once with min_node_num=1, the label set of benchmark.py is derived from it
+    full_database = create_database(dataset_path, None, 1, str(tmp_path / "full.npy"))
+    valid_label_list = benchmark.LABEL_LIST[:4]
+
+    for min_node_num in [1, 2, 4]:
+        direct_path = str(tmp_path / ("direct_" + str(min_node_num) + ".npy"))
+        remap_path = str(tmp_path / ("remap_" + str(min_node_num) + ".npy"))
+        create_database(dataset_path, valid_label_list, min_node_num, direct_path)
+
+        lut = full_database.label.create_remap_lut(valid_label_list)
+        remap_index = full_database.label.create_remap_index(valid_label_list)
+        suncg_loader.remap_npy(str(tmp_path / "full.npy"), remap_path, lut, 5, remap_index, min_node_num)
+
+        direct_data = np.load(direct_path)
+        remap_data = np.load(remap_path)
+        assert remap_data.shape == direct_data.shape
+
+        # pixels only differ where a dropped label was painted over a kept one
+        full_data = np.load(str(tmp_path / "full.npy"))
+        label_count = np.load(suncg_loader.get_label_count_path(str(tmp_path / "full.npy")))
+        row_array = np.nonzero(label_count[:, remap_index > 0].sum(axis=1) >= min_node_num)[0]
+        dropped_mask = remap_index[full_data[row_array]] == 0
+        assert np.array_equal(remap_data[~dropped_mask], direct_data[~dropped_mask])